@@ -1,40 +1,113 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+from email.utils import formatdate, parsedate_to_datetime
 import threading
 import time
+import uuid
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from concurrent.futures import ThreadPoolExecutor
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field, validator
 
 
-from backend.config import DEFAULT_WORKERS, HASH_DB, TRASH_DIR, THUMBNAIL_MAX_SIZE
-from backend.core.hash_engine import scan_and_group
-from backend.core.file_manager import TrashConfig, move_to_trash
-from backend.state import JOB_STORE, GroupResult, ScanJob
+from backend.config import (
+    DEFAULT_WORKERS,
+    HASH_DB,
+    JOB_MAX_AGE_DAYS,
+    JOB_RETENTION,
+    STATS_DB,
+    TRASH_DIR,
+    TRASH_JOURNAL_DIR,
+    TRASH_JOURNALS_KEPT,
+    TRASH_WORKERS,
+    THUMBNAIL_MAX_SIZE,
+    THUMBNAIL_PREWARM_WORKERS,
+)
+from backend.core.hash_engine import ENGINES, FileEntry, PreviousScan, scan
+from backend.core.hashing import DEFAULT_HASH_SIZE, EXECUTORS
+from backend.core.file_manager import (
+    TrashConfig,
+    TrashJournal,
+    move_to_trash,
+    pending_journals,
+    prune_journals,
+    recover_journal,
+    undo_trash,
+)
+from backend.liveness import LivenessIndex
+from backend.prewarm import ThumbnailPrewarmer
+from backend.state import CASCADE_PHASES, JOB_STORE, TRASH_JOBS, GroupResult, ScanJob, TrashJob
 from backend.storage import SQLiteStore
-from backend.utils.thumbnails import thumbnail_bytes
+from backend.thumbnail_gc import ThumbnailGC
+from backend.utils.thumbnails import (
+    FORMATS,
+    LIST_SIZE,
+    PREFERRED_FORMAT,
+    REVIEW_SIZES,
+    THUMBNAILS,
+    WEBP_ENABLED,
+    cache_key,
+    contact_sheet,
+    sheet_key,
+    source_origin,
+    start_migration,
+    thumbnail_bytes,
+)
 from backend.utils.image_utils import image_stats, suggest_keeper
+from backend.utils.stats_store import FileKey, StatsStore
 
 router = APIRouter()
 STORE = SQLiteStore()
-# Load persisted jobs on startup
-JOB_STORE.reset(STORE.load_jobs())
+STATS = StatsStore(STATS_DB)
+LIVENESS = LivenessIndex(STORE)
+PREWARM = ThumbnailPrewarmer(STORE, JOB_STORE, THUMBNAIL_PREWARM_WORKERS)
+THUMBNAIL_GC = ThumbnailGC(STORE, THUMBNAILS)
+# Seconds between progress events pushed to a client
+EVENT_INTERVAL = 0.5
+# Seconds of silence after which a comment is sent to keep proxies from closing the stream
+EVENT_KEEPALIVE = 15.0
+FINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+# Scored groups are written to the store every STREAM_BATCH groups or STREAM_INTERVAL seconds
+STREAM_BATCH = 200
+STREAM_INTERVAL = 2.0
+# Thumbnail URLs carrying the file version (`v`, its mtime) never change content
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+# Other thumbnail responses may be stored but are revalidated with their ETag on every use
+REVALIDATE_CACHE = "no-cache"
+# Groups with more members than this have no contact sheet; the UI loads single thumbnails instead
+SHEET_MAX_MEMBERS = 100
+# Thumbnail sizes contact sheets are made of (the review row and group list); a sheet of larger
+# cells would be a full-size canvas per request, outside the decode memory budget
+SHEET_SIZES = (REVIEW_SIZES[-1], LIST_SIZE)
+# Trash jobs into the same destination run one after another (they share its names)
+_TRASH_LOCKS: Dict[str, threading.Lock] = {}
+_TRASH_LOCKS_GUARD = threading.Lock()
+# Held while checking for and starting an undo, so one journal is undone by one job at a time
+_UNDO_GUARD = threading.Lock()
 
 
 class ScanRequest(BaseModel):
     directories: List[Path] = Field(..., description="List of directories to scan")
     primary_dir: Optional[Path] = Field(None, description="Primary directory to keep")
     hash_size: Optional[int] = Field(None, ge=2, le=64, description="Hash size (tunes similarity)")
-    workers: Optional[int] = Field(DEFAULT_WORKERS, ge=1, description="Thread count for hashing")
+    max_distance: int = Field(0, ge=0, le=64, description="Max Hamming distance between similar hashes")
+    workers: Optional[int] = Field(DEFAULT_WORKERS, ge=1, description="Thread (or process) count for hashing")
+    executor: str = Field("thread", description="Native hashing pool: thread, or process to use every core")
     algorithm: str = Field("phash", description="duplicate_images algorithm")
-    hash_db: Optional[Path] = Field(HASH_DB, description="Path to hash cache (JSON)")
+    engine: str = Field("native", description="Hashing engine: native (vectorized) or library (duplicate_images)")
+    hash_db: Optional[Path] = Field(HASH_DB, description="Path to hash cache (SQLite)")
     exclude_regexes: Optional[List[str]] = Field(None, description="Regex to exclude paths")
     enable_sharpness_check: Optional[bool] = Field(False, description="Enable sharpness check for suggested image")
+    incremental: bool = Field(False, description="Only rehash files changed since the last matching scan")
+    cascade: bool = Field(
+        False, description="Hash every file with a cheap coarse hash first; compute the requested hash only for candidates"
+    )
 
     @validator("directories", each_item=True)
     def _must_exist(cls, value: Path) -> Path:
@@ -48,6 +121,18 @@ class ScanRequest(BaseModel):
             raise ValueError(f"Primary directory not found: {value}")
         return value.resolve() if value else value
 
+    @validator("engine")
+    def _known_engine(cls, value: str) -> str:
+        if value not in ENGINES:
+            raise ValueError(f"Unknown engine: {value}")
+        return value
+
+    @validator("executor")
+    def _known_executor(cls, value: str) -> str:
+        if value not in EXECUTORS:
+            raise ValueError(f"Unknown executor: {value}")
+        return value
+
     @validator("hash_db")
     def _ensure_parent(cls, value: Optional[Path]) -> Optional[Path]:
         if value:
@@ -65,6 +150,36 @@ class JobStatusResponse(BaseModel):
     status: str
     message: str
     groups: int
+    phase: Optional[str] = None
+    processed: int = 0
+    total: int = 0
+    rate: Optional[float] = None  # files (groups while suggesting) per second
+    eta: Optional[int] = None  # seconds left in the current phase
+    progress_percent: float = 0.0
+
+
+class TrashJobResponse(BaseModel):
+    trash_id: str
+    job_id: Optional[str]
+    kind: str
+    status: str
+    message: str
+    moved: int
+    failed: int
+    undoable: bool
+    phase: Optional[str] = None
+    processed: int = 0
+    total: int = 0
+    rate: Optional[float] = None  # files per second
+    eta: Optional[int] = None  # seconds left
+    progress_percent: float = 0.0
+
+
+class TrashPlanResponse(BaseModel):
+    groups: int  # groups with files to trash
+    files: int  # files to trash
+    kept: int  # files kept in those groups
+    bytes: int  # reclaimed
 
 
 class GroupOut(BaseModel):
@@ -76,6 +191,7 @@ class GroupOut(BaseModel):
 
 class GroupsResponse(BaseModel):
     job_id: str
+    status: str  # "running" while groups are still being added
     total_groups: int
     groups: List[GroupOut]
     directories: List[str]
@@ -124,10 +240,16 @@ def _process_group_for_suggestion(
     group_id: int,
     primary_dir: Optional[Path],
     enable_sharpness_check: bool,
+    cached_stats: Optional[Dict[str, Dict]] = None,
 ) -> GroupResult:
-    """Helper function to process a single group for suggestions."""
-    stats = {str(path): image_stats(path) for path in group}
-    suggested = suggest_keeper(list(group), primary_dir, enable_sharpness_check)
+    """
+    Helper function to process a single group for suggestions.
+    Files missing from `cached_stats` are decoded once; the stats record feeds the suggestion
+    and the API, and the review thumbnails are cached from the same decode.
+    """
+    cached_stats = cached_stats or {}
+    stats = {str(path): cached_stats.get(str(path)) or image_stats(path, REVIEW_SIZES) for path in group}
+    suggested = suggest_keeper(list(group), primary_dir, enable_sharpness_check, stats)
     return GroupResult(
         id=group_id,
         files=[str(p) for p in group],
@@ -136,31 +258,150 @@ def _process_group_for_suggestion(
     )
 
 
+def _stat_keys(files: Iterable[Path], snapshot: Optional[Sequence[FileEntry]]) -> Dict[str, FileKey]:
+    """(path, size, mtime) per file, taken from the scan snapshot when there is one."""
+    known = {str(e.path): e for e in snapshot or ()}
+    keys: Dict[str, FileKey] = {}
+    for path in files:
+        entry = known.get(str(path))
+        if entry:
+            keys[str(path)] = (str(path), entry.size, entry.mtime)
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        keys[str(path)] = (str(path), st.st_size, st.st_mtime)
+    return keys
+
+
+def _find_previous_job(payload: ScanRequest) -> Optional[ScanJob]:
+    """Latest successful job over the same directories with the same hashing parameters."""
+    directories = sorted(str(p) for p in payload.directories)
+    hash_size = payload.hash_size or DEFAULT_HASH_SIZE
+    candidates = [
+        job
+        for job in JOB_STORE.all()
+        if job.status == "succeeded"
+        and sorted(job.directories) == directories
+        and job.algorithm == payload.algorithm
+        and (job.hash_size or DEFAULT_HASH_SIZE) == hash_size
+        and (job.threshold or 0) == payload.max_distance
+    ]
+    return max(candidates, key=lambda job: job.created_at, default=None)
+
+
+def _apply_retention() -> None:
+    """
+    Delete finished jobs beyond the newest JOB_RETENTION or older than JOB_MAX_AGE_DAYS, then
+    compact the store. Running scans and the latest reviewable job are always kept.
+    """
+    finished = sorted(
+        (job for job in JOB_STORE.all() if job.status not in ("pending", "running")),
+        key=lambda job: job.created_at,
+        reverse=True,
+    )
+    reviewable = next((job for job in finished if job.status == "succeeded" and job.group_count > 0), None)
+    expired = finished[JOB_RETENTION:] if JOB_RETENTION else []
+    if JOB_MAX_AGE_DAYS:
+        cutoff = time.time() - JOB_MAX_AGE_DAYS * 86400
+        expired.extend(job for job in finished[: len(finished) - len(expired)] if job.created_at < cutoff)
+    doomed = [job.id for job in expired if job is not reviewable]
+    if not doomed:
+        return
+    try:
+        STORE.delete_jobs(doomed)
+        JOB_STORE.discard(doomed)
+        for job_id in doomed:
+            LIVENESS.forget(job_id)
+            PREWARM.stop(job_id)
+        removed = STORE.compact()
+        logging.info("Deleted %d old jobs and %d unreferenced files", len(doomed), removed)
+    except Exception:  # noqa: BLE001
+        logging.exception("Job retention failed")
+
+
+@router.on_event("startup")
+def _startup() -> None:
+    # Load persisted job headers; groups are read from the store when first needed. Nothing is
+    # opened at import time: process-pool hashing workers import the app module again.
+    JOB_STORE.loader = STORE.load_groups
+    JOB_STORE.reset(STORE.load_jobs())
+    start_migration()
+    # Old databases can hold many expired jobs: prune them without delaying startup
+    threading.Thread(target=_apply_retention, daemon=True).start()
+    # Stale thumbnails are collected incrementally from here on (not when a scan starts)
+    THUMBNAIL_GC.start()
+    threading.Thread(target=_recover_trash, daemon=True).start()
+
+
+def _recover_trash() -> None:
+    """Settle moves to a trash directory that were interrupted by a crash or restart, and prune old journals."""
+    if not TRASH_JOURNAL_DIR.exists():
+        return
+    for journal in pending_journals(TRASH_JOURNAL_DIR):
+        try:
+            LIVENESS.mark_missing(str(p) for p in recover_journal(journal))
+        except Exception:  # noqa: BLE001
+            logging.exception("Could not recover trash journal %s", journal.path)
+    pruned = prune_journals(TRASH_JOURNAL_DIR, TRASH_JOURNALS_KEPT)
+    if pruned:
+        logging.info("Deleted %d old trash journals", pruned)
+
+
+def _reuse_group(previous: GroupResult, group_id: int, payload: ScanRequest) -> GroupResult:
+    """Carry a group over from the previous job, re-scoring it from its stored stats."""
+    suggested = suggest_keeper(
+        [Path(f) for f in previous.files], payload.primary_dir, payload.enable_sharpness_check, previous.stats
+    )
+    return GroupResult(id=group_id, files=list(previous.files), suggested=str(suggested), stats=previous.stats)
+
+
 def _run_scan(job: ScanJob, payload: ScanRequest) -> None:
     job.status = "running"
+    if payload.cascade:
+        job.progress.phases = CASCADE_PHASES
     JOB_STORE.update(job)
     STORE.save_job(job)
 
-    # Helper function to perform the actual scan_and_group logic
+    previous_job = _find_previous_job(payload)
+    previous: Optional[PreviousScan] = None
+    previous_groups: List[GroupResult] = []
+    if payload.incremental and previous_job:
+        snapshot = STORE.load_snapshot(previous_job.id)
+        if snapshot:
+            logging.info("Incremental scan against job %s", previous_job.id)
+            previous_groups = JOB_STORE.groups(previous_job)
+            previous = PreviousScan(snapshot=snapshot, groups=[tuple(g.files) for g in previous_groups])
+
+    # Helper function to perform the actual scan logic
     def perform_scan_attempt():
         # Check if cancelled before starting scan
         current_job = JOB_STORE.get(job.id)
         if current_job and current_job.cancel_requested:
             return None  # Signal cancellation
 
-        return scan_and_group(
+        return scan(
             directories=[p for p in payload.directories],
             hash_size=payload.hash_size,
             workers=payload.workers,
             algorithm=payload.algorithm,
             hash_db=payload.hash_db,
             exclude_regexes=payload.exclude_regexes,
+            engine=payload.engine,
+            max_distance=payload.max_distance,
+            previous=previous,
+            executor=payload.executor,
+            progress=job.progress.update,
+            cascade=payload.cascade,
         )
 
     groups = None # Initialize groups to None
+    result = None
     try:
         try:
-            groups = perform_scan_attempt()
+            result = perform_scan_attempt()
+            groups = result.groups if result else None
 
             # Check if cancelled after scan completes
             current_job = JOB_STORE.get(job.id)
@@ -169,33 +410,6 @@ def _run_scan(job: ScanJob, payload: ScanRequest) -> None:
                 job.message = "Scan cancelled by user"
                 return
 
-        except ValueError as err:
-            # Check for Metadata mismatch error from duplicate_images library
-            if "Metadata mismatch" in str(err) and payload.hash_db and payload.hash_db.exists():
-                logging.warning(f"Metadata mismatch detected in hash_db: {payload.hash_db}. Attempting to clear and retry.")
-                try:
-                    payload.hash_db.unlink()  # Delete the conflicting hash_db file
-                    logging.info(f"Cleared hash_db: {payload.hash_db}. Retrying scan.")
-                    groups = perform_scan_attempt() # Retry scan
-
-                    # Check cancellation after retry
-                    current_job = JOB_STORE.get(job.id)
-                    if groups is None or (current_job and current_job.cancel_requested):
-                        job.status = "cancelled"
-                        job.message = "Scan cancelled by user"
-                        return
-
-                except Exception as retry_err:
-                    logging.exception(f"Scan failed after clearing hash_db and retrying: {retry_err}")
-                    job.status = "failed"
-                    job.message = f"Scan failed after hash_db reset: {retry_err}"
-                    groups = None # Ensure groups is None if retry fails
-            else:
-                # Not a metadata mismatch ValueError, treat as regular failure
-                logging.exception("Scan failed with unexpected ValueError")
-                job.status = "failed"
-                job.message = str(err)
-                groups = None
         except Exception as err:  # Catch any other general exceptions during scan attempt
             logging.exception("Scan failed")
             job.status = "failed"
@@ -211,24 +425,46 @@ def _run_scan(job: ScanJob, payload: ScanRequest) -> None:
 
         # Only proceed to process groups if a valid 'groups' list was obtained and job status is not already failed
         if groups is not None and job.status != "failed":
+            # Scored groups are published on the job as they complete, so /groups can page
+            # through them while the scan is still running
             group_results: List[GroupResult] = []
+            JOB_STORE.pin_groups(job.id, group_results)
+            # Review thumbnails are generated in the background as groups reach the store
+            PREWARM.focus(job.id)
+            unsaved: List[GroupResult] = []
+            last_flush = time.monotonic()
             primary_dir = payload.primary_dir
 
+            # Stats of files whose size and mtime are unchanged since an earlier scan come from
+            # the persistent cache; only the rest are decoded, and those are cached in turn
+            stat_keys = _stat_keys(
+                (p for idx, group in enumerate(groups) if idx not in result.reused for p in group),
+                result.snapshot,
+            )
+            cached_stats = STATS.lookup(list(stat_keys.values()))
+            logging.info("%d of %d file stats loaded from cache", len(cached_stats), len(stat_keys))
+            new_stats: List[Tuple[str, int, float, Dict]] = []
+
             with ThreadPoolExecutor(max_workers=payload.workers) as executor:
                 # Submit each group for parallel processing
+                # Groups carried over unchanged from the previous job keep their stats
                 futures = [
-                    executor.submit(
+                    executor.submit(_reuse_group, previous_groups[result.reused[idx]], idx + 1, payload)
+                    if idx in result.reused
+                    else executor.submit(
                         _process_group_for_suggestion,
                         group,
                         idx + 1,  # group_id
                         primary_dir,
                         payload.enable_sharpness_check,
+                        cached_stats,
                     )
                     for idx, group in enumerate(groups)
                 ]
 
                 # Collect results as they complete
-                for future in futures:
+                job.progress.update("suggest", 0, len(futures))
+                for done, future in enumerate(futures, 1):
                     # Check cancellation between processing each group
                     current_job = JOB_STORE.get(job.id)
                     if current_job and current_job.cancel_requested:
@@ -236,11 +472,42 @@ def _run_scan(job: ScanJob, payload: ScanRequest) -> None:
                         job.message = "Scan cancelled by user"
                         return
 
-                    group_results.append(future.result())
-
-            job.groups = group_results
+                    group_result = future.result()
+                    group_results.append(group_result)
+                    job.group_count = len(group_results)
+                    unsaved.append(group_result)
+                    new_stats.extend(
+                        (*stat_keys[path], meta)
+                        for path, meta in group_result.stats.items()
+                        # zeroed records are read failures: retry them next time
+                        if path in stat_keys and path not in cached_stats and meta.get("width")
+                    )
+                    job.progress.update("suggest", done, len(futures))
+                    if len(unsaved) >= STREAM_BATCH or time.monotonic() - last_flush > STREAM_INTERVAL:
+                        STORE.append_groups(job.id, unsaved)
+                        STATS.store(new_stats)
+                        unsaved, new_stats, last_flush = [], [], time.monotonic()
+
+            job.progress.update("persist", 0, 1)
+            STORE.append_groups(job.id, unsaved)
+            STATS.store(new_stats)
             job.status = "succeeded"
-            STORE.save_groups(job.id, group_results)
+            if result.incremental:
+                job.message = (
+                    f"Incremental scan: {result.changed_files} new or changed files, "
+                    f"{len(result.reused)} of {len(group_results)} groups carried over"
+                )
+            elif previous:
+                logging.info("Incremental scan request ignored: the library engine rehashes every file")
+            if result.snapshot is not None:
+                STORE.save_snapshot(
+                    job.id,
+                    ((str(e.path), e.inode, e.size, e.mtime) for e in result.snapshot),
+                    replaces=previous_job.id if previous_job else None,
+                )
+                evicted = STATS.evict(job.directories, {str(e.path) for e in result.snapshot})
+                logging.info("Evicted %d stale file stats", evicted)
+            job.progress.update("persist", 1, 1)
         elif groups is None and job.status != "failed":
             # This path is hit if perform_scan_attempt() resulted in groups being None
             # but job.status wasn't explicitly set to "failed" yet.
@@ -257,22 +524,17 @@ def _run_scan(job: ScanJob, payload: ScanRequest) -> None:
         job.finished_at = time.time()
         JOB_STORE.update(job)
         STORE.save_job(job)
+        JOB_STORE.unpin_groups(job.id)
+        if job.status == "succeeded":
+            _apply_retention()
 
 
 @router.post("/scan", response_model=ScanResponse)
 def start_scan(payload: ScanRequest) -> ScanResponse:
-    # Auto-cleanup orphaned thumbnails before starting scan
-    try:
-        from backend.utils.cleanup import cleanup_orphaned_thumbnails
-        cleanup_orphaned_thumbnails()
-    except Exception as e:
-        logging.warning(f"Auto-cleanup failed: {e}")
-        # Don't block scan on cleanup failure
-
     job = JOB_STORE.create(
         directories=[str(p) for p in payload.directories],
         primary_dir=str(payload.primary_dir) if payload.primary_dir else None,
-        threshold=0,  # Unused - kept for database compatibility
+        threshold=payload.max_distance,
         algorithm=payload.algorithm,
         workers=payload.workers,
         hash_db=str(payload.hash_db) if payload.hash_db else None,
@@ -289,7 +551,53 @@ def get_job_status(job_id: str) -> JobStatusResponse:
     job = JOB_STORE.get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return JobStatusResponse(job_id=job.id, status=job.status, message=job.message, groups=len(job.groups))
+    return _job_status(job)
+
+
+def _job_status(job: ScanJob) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job.id,
+        status=job.status,
+        message=job.message,
+        groups=job.group_count,
+        **job.progress.snapshot(),
+    )
+
+
+@router.get("/scan/{job_id}/events")
+async def scan_events(job_id: str, request: Request) -> StreamingResponse:
+    """
+    Server-sent events stream of a scan's progress (same fields as GET /scan/{job_id}).
+    Updates are sampled every EVENT_INTERVAL seconds and only sent when something changed;
+    the stream ends with a "done" event once the job reaches a final status.
+    """
+    if not JOB_STORE.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream():
+        last = None
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            job = JOB_STORE.get(job_id)
+            if not job:
+                return
+            status = _job_status(job).dict()
+            final = job.status in FINAL_STATUSES
+            if status != last:
+                last, last_sent = status, time.monotonic()
+                yield f"event: {'done' if final else 'progress'}\ndata: {json.dumps(status)}\n\n"
+            elif time.monotonic() - last_sent > EVENT_KEEPALIVE:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            if final:
+                return
+            await asyncio.sleep(EVENT_INTERVAL)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/scan/{job_id}/stop")
@@ -314,56 +622,141 @@ def stop_scan(job_id: str) -> Dict[str, str]:
 
 
 @router.get("/groups", response_model=GroupsResponse)
-def list_groups(job_id: str, limit: int = 50, offset: int = 0) -> GroupsResponse:
+def list_groups(job_id: str, limit: int = 50, offset: int = 0, after: Optional[int] = None) -> GroupsResponse:
+    """
+    Page through a job's groups in id order, leaving out files known to be missing.
+    Pass `after` (the last group id of the previous page) for keyset pagination.
+    """
     job = JOB_STORE.get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    filtered_groups: List[GroupResult] = []
-    for group_result in job.groups:
-        existing_files: List[str] = []
-        for file_path in group_result.files:
-            if Path(file_path).exists():
-                existing_files.append(file_path)
-
-        if existing_files:
-            updated_suggested: Optional[str] = group_result.suggested
-            if updated_suggested and not Path(updated_suggested).exists():
-                updated_suggested = existing_files[0] if existing_files else None
-
-            # If suggested becomes None but there are existing files, pick the first one
-            if not updated_suggested and existing_files:
-                updated_suggested = existing_files[0]
-
-            filtered_groups.append(
-                GroupResult(
-                    id=group_result.id,
-                    files=existing_files,
-                    suggested=updated_suggested,
-                    stats=group_result.stats, # Keep original stats, they might contain info for deleted files
-                )
-            )
-    
-    # Sort groups by ID after filtering
-    filtered_groups.sort(key=lambda g: g.id)
+    # Paginated in SQL; only this page's files are checked on disk
+    total, selected = LIVENESS.page(job, offset, limit, after)
+    if selected:
+        PREWARM.focus(job.id, selected[0].id)
+    for group_result in selected:
+        # If the suggested file is gone, fall back to the first remaining one
+        if group_result.suggested not in group_result.files:
+            group_result.suggested = group_result.files[0]
 
-    selected = filtered_groups[offset : offset + limit]
     group_out = [GroupOut(**gr.__dict__) for gr in selected]
-    return GroupsResponse(job_id=job.id, total_groups=len(filtered_groups), groups=group_out, directories=job.directories)
+    return GroupsResponse(
+        job_id=job.id,
+        status=job.status,
+        total_groups=total,
+        groups=group_out,
+        directories=job.directories,
+    )
 
 
-@router.post("/actions/trash")
-def trash_files(payload: TrashRequest):
+@router.get("/groups/{group_id}/sheet")
+def get_group_sheet(request: Request, group_id: int, job_id: str, max_size: int = REVIEW_SIZES[-1]):
+    """
+    Thumbnails of all of a group's files in one sprite image, as a multipart/form-data body: a
+    "map" part (JSON, each file path -> its [x, y, width, height] cell) and the "sheet" image.
+    The map is in the body rather than a header, which proxies limit to a few KB.
+    The group's files are taken from the store, so no per-file path validation is needed.
+    Validators and 304s work as for /thumbnail. Responses are always revalidated, since
+    membership changes when files are trashed.
+    """
+    if max_size not in SHEET_SIZES:
+        raise HTTPException(status_code=400, detail=f"Contact sheets come in sizes {', '.join(map(str, SHEET_SIZES))}")
+    job = JOB_STORE.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    group = STORE.load_group(job.id, group_id)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Group not found")
+    if len(group.files) > SHEET_MAX_MEMBERS:
+        raise HTTPException(status_code=413, detail=f"Contact sheets cover at most {SHEET_MAX_MEMBERS} files")
+    sources: List[Path] = []
+    keys: List[str] = []
+    mtimes: List[float] = []
+    missing: List[str] = []
+    for path in group.files:
+        try:
+            origin = source_origin(Path(path))
+        except FileNotFoundError:
+            missing.append(path)
+            continue
+        keys.append(cache_key(origin, max_size, PREFERRED_FORMAT))
+        mtimes.append(origin[1])
+        sources.append(Path(path))
+    if missing:
+        LIVENESS.mark_missing(missing)
+    if not sources:
+        raise HTTPException(status_code=404, detail="Group not found")
+    fmt = "webp" if WEBP_ENABLED and "image/webp" in request.headers.get("accept", "") else "jpeg"
+    key = sheet_key(keys, fmt)
+    mtime = max(mtimes)
+    headers = {
+        "ETag": f'"{key}"',
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": REVALIDATE_CACHE,
+        "Vary": "Accept",
+    }
+    # Only the ETag identifies the member set: If-Modified-Since alone would miss a trashed file
+    if request.headers.get("if-none-match") and _not_modified(request, headers["ETag"], mtime):
+        return Response(status_code=304, headers=headers)
+    try:
+        data, cells = contact_sheet(key, sources, max_size, fmt)
+    except Exception as err:  # noqa: BLE001
+        logging.error("Contact sheet failed for group %s of job %s: %s", group_id, job.id, err)
+        raise HTTPException(status_code=500, detail="Contact sheet generation failed")
+    body, media_type = _form_data(
+        [
+            ("map", None, "application/json", json.dumps(cells, separators=(",", ":")).encode()),
+            ("sheet", f"sheet.{fmt}", FORMATS[fmt][1], data),
+        ]
+    )
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _form_data(parts: Sequence[Tuple[str, Optional[str], str, bytes]]) -> Tuple[bytes, str]:
+    """multipart/form-data body of (name, file name, content type, data) parts, and its media type."""
+    boundary = uuid.uuid4().hex
+    while any(boundary.encode() in data for _, _, _, data in parts):
+        boundary = uuid.uuid4().hex
+    chunks: List[bytes] = []
+    for name, filename, content_type, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        chunks.append(
+            f"--{boundary}\r\nContent-Disposition: {disposition}\r\nContent-Type: {content_type}\r\n\r\n".encode()
+        )
+        chunks += [data, b"\r\n"]
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/form-data; boundary={boundary}"
+
+
+@router.post("/actions/trash", response_model=TrashJobResponse)
+def trash_files(payload: TrashRequest) -> TrashJobResponse:
+    """Start moving files to the trash in the background; follow it with GET /actions/trash/{trash_id}."""
     job = JOB_STORE.get(payload.job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     cfg = TrashConfig(trash_dir=payload.destination, recreate_paths=payload.recreate_paths)
-    move_to_trash(payload.paths, cfg)
-    return {"status": "ok", "trashed": [str(p) for p in payload.paths]}
+    return _trash_status(_start_trash(job, lambda: payload.paths, cfg))
+
+
+@router.post("/actions/trash-non-primary/plan", response_model=TrashPlanResponse)
+def plan_trash_non_primary(payload: TrashNonPrimaryRequest) -> TrashPlanResponse:
+    """Dry run of trash-non-primary: what would be trashed, without moving anything."""
+    job = _keep_primary_job(payload)
+    groups, files, kept, size = STORE.root_plan(job.id, str(payload.primary_dir))
+    return TrashPlanResponse(groups=groups, files=files, kept=kept, bytes=size)
+
+
+@router.post("/actions/trash-non-primary", response_model=TrashJobResponse)
+def trash_non_primary(payload: TrashNonPrimaryRequest) -> TrashJobResponse:
+    """Trash every file outside the primary directory from groups that have a copy inside it (in the background)."""
+    job = _keep_primary_job(payload)
+    cfg = TrashConfig(trash_dir=payload.destination, recreate_paths=payload.recreate_paths)
+    primary_dir = str(payload.primary_dir)
+    return _trash_status(_start_trash(job, lambda: [Path(p) for p in STORE.outside_root(job.id, primary_dir)], cfg))
 
 
-@router.post("/actions/trash-non-primary")
-def trash_non_primary(payload: TrashNonPrimaryRequest):
+def _keep_primary_job(payload: TrashNonPrimaryRequest) -> ScanJob:
     job = JOB_STORE.get(payload.job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -392,20 +785,134 @@ def trash_non_primary(payload: TrashNonPrimaryRequest):
             detail=f"Primary directory {payload.primary_dir} was not part of the scan"
         )
 
-    victims: List[Path] = []
-    for group in job.groups:
-        primary_files = [Path(f) for f in group.files if payload.primary_dir in Path(f).parents]
-        if primary_files:
-            victims.extend([Path(f) for f in group.files if f not in {str(p) for p in primary_files}])
-    cfg = TrashConfig(trash_dir=payload.destination, recreate_paths=payload.recreate_paths)
-    move_to_trash(victims, cfg)
-    return {"status": "ok", "trashed": [str(p) for p in victims]}
+    return job
+
+
+@router.get("/actions/trash/{trash_id}", response_model=TrashJobResponse)
+def get_trash_status(trash_id: str) -> TrashJobResponse:
+    trash = TRASH_JOBS.get(trash_id)
+    if not trash:
+        raise HTTPException(status_code=404, detail="Trash job not found")
+    return _trash_status(trash)
+
+
+@router.post("/actions/trash/{trash_id}/undo", response_model=TrashJobResponse)
+def undo_trash_job(trash_id: str) -> TrashJobResponse:
+    """Move the files of a trash job back where they were (only for moves to a trash directory)."""
+    journal = _journal_path(trash_id)
+    if journal is None or not journal.exists():
+        raise HTTPException(status_code=404, detail="No undo journal for this trash job")
+    original = TRASH_JOBS.get(trash_id)
+    if original and original.status in ("pending", "running"):
+        raise HTTPException(status_code=400, detail="Trash job is still running")
+    with _UNDO_GUARD:
+        if any(job.kind == "undo" and job.journal == str(journal) for job in TRASH_JOBS.active()):
+            raise HTTPException(status_code=409, detail="This trash job is already being undone")
+        undo = TRASH_JOBS.create(job_id=original.job_id if original else None, kind="undo", journal=str(journal))
+    cfg = TrashConfig(trash_dir=TrashJournal(journal).destination())
+    threading.Thread(target=_run_undo, args=(undo, cfg), daemon=True).start()
+    return _trash_status(undo)
+
+
+def _journal_path(trash_id: str) -> Optional[Path]:
+    try:
+        return TRASH_JOURNAL_DIR / f"{uuid.UUID(trash_id)}.jsonl"
+    except ValueError:
+        return None
+
+
+def _trash_status(trash: TrashJob) -> TrashJobResponse:
+    return TrashJobResponse(
+        trash_id=trash.id,
+        job_id=trash.job_id,
+        kind=trash.kind,
+        status=trash.status,
+        message=trash.message,
+        moved=trash.moved,
+        failed=trash.failed,
+        undoable=trash.kind == "trash" and trash.journal is not None and trash.status == "succeeded",
+        **trash.progress.snapshot(),
+    )
+
+
+def _start_trash(job: ScanJob, victims: Callable[[], List[Path]], cfg: TrashConfig) -> TrashJob:
+    """Trash the files `victims` returns, which is called on the job's thread (planning can take a while)."""
+    trash = TRASH_JOBS.create(job_id=job.id, kind="trash", journal=None)
+    if cfg.trash_dir:
+        trash.journal = str(_journal_path(trash.id))
+    threading.Thread(target=_run_trash, args=(trash, victims, cfg), daemon=True).start()
+    return trash
+
+
+def _trash_lock(cfg: TrashConfig) -> threading.Lock:
+    """One lock per destination (trash directory, or the system trash)."""
+    key = str(cfg.trash_dir.resolve()) if cfg.trash_dir else ""
+    with _TRASH_LOCKS_GUARD:
+        return _TRASH_LOCKS.setdefault(key, threading.Lock())
+
+
+def _run_trash(trash: TrashJob, victims: Callable[[], List[Path]], cfg: TrashConfig) -> None:
+    with _trash_lock(cfg):
+        _trash(trash, victims, cfg)
+
+
+def _trash(trash: TrashJob, victims: Callable[[], List[Path]], cfg: TrashConfig) -> None:
+    trash.status = "running"
+    try:
+        paths = victims()
+        trash.progress.update("trash", 0, len(paths))
+        journal = TrashJournal(Path(trash.journal)) if trash.journal else None
+        gone = move_to_trash(
+            paths,
+            cfg,
+            journal,
+            progress=lambda done, total: trash.progress.update("trash", done, total),
+            workers=TRASH_WORKERS,
+        )
+        LIVENESS.mark_missing(str(p) for p in gone)
+        trash.moved, trash.failed = len(gone), len(paths) - len(gone)
+        trash.message = f"{trash.moved} files moved to trash" + (f", {trash.failed} failed" if trash.failed else "")
+        trash.status = "succeeded"
+    except Exception as err:  # noqa: BLE001
+        logging.exception("Trash job %s failed", trash.id)
+        trash.status = "failed"
+        trash.message = str(err)
+    finally:
+        trash.finished_at = time.time()
+
+
+def _run_undo(undo: TrashJob, cfg: TrashConfig) -> None:
+    # Restores take names back from the trash directory: trash jobs into it wait meanwhile
+    with _trash_lock(cfg):
+        _undo(undo)
+
+
+def _undo(undo: TrashJob) -> None:
+    undo.status = "running"
+    try:
+        restored = undo_trash(
+            TrashJournal(Path(undo.journal)),
+            progress=lambda done, total: undo.progress.update("restore", done, total),
+            workers=TRASH_WORKERS,
+        )
+        LIVENESS.mark_missing((str(p) for p in restored), missing=False)
+        undo.moved, undo.failed = len(restored), undo.progress.total - len(restored)
+        undo.message = f"{undo.moved} files restored" + (f", {undo.failed} failed" if undo.failed else "")
+        undo.status = "succeeded"
+    except Exception as err:  # noqa: BLE001
+        logging.exception("Undo %s failed", undo.id)
+        undo.status = "failed"
+        undo.message = str(err)
+    finally:
+        undo.finished_at = time.time()
 
 
 @router.post("/admin/rebuild-db")
 def rebuild_db():
     STORE.rebuild()
     JOB_STORE.reset([])
+    LIVENESS.forget()
+    PREWARM.stop()
     return {"status": "ok", "message": "Database rebuilt (tables recreated and cleared)"}
 
 
@@ -446,7 +953,7 @@ def get_latest_job() -> LatestJobResponse:
     # Find most recent job with groups > 0 (reviewable job)
     reviewable_job = None
     for job in sorted_jobs:
-        if job.status == "succeeded" and len(job.groups) > 0:
+        if job.status == "succeeded" and job.group_count > 0:
             reviewable_job = job
             break
 
@@ -455,7 +962,7 @@ def get_latest_job() -> LatestJobResponse:
         return LatestJobResponse(
             job_id=reviewable_job.id,
             status=reviewable_job.status,
-            groups=len(reviewable_job.groups)
+            groups=reviewable_job.group_count
         )
 
     # Otherwise, return the most recent job (for status messaging)
@@ -465,12 +972,39 @@ def get_latest_job() -> LatestJobResponse:
     return LatestJobResponse(
         job_id=latest_job.id if latest_job.status == "running" else None,
         status=latest_job.status,
-        groups=len(latest_job.groups)
+        groups=latest_job.group_count
     )
 
 
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match (which takes precedence) or If-Modified-Since."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+        return etag in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 @router.get("/thumbnail")
-def get_thumbnail(job_id: str, path: str, max_size: int = THUMBNAIL_MAX_SIZE):
+def get_thumbnail(
+    request: Request,
+    job_id: str,
+    path: str,
+    max_size: int = THUMBNAIL_MAX_SIZE,
+    v: Optional[float] = None,
+):
+    """
+    Cached thumbnail of a scanned file, as WebP when enabled and accepted, else JPEG.
+    `v` is the file's mtime as listed with its group; URLs carrying the current one are cached
+    by the browser for good, the rest are revalidated through their ETag.
+    """
     job = JOB_STORE.get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -484,11 +1018,30 @@ def get_thumbnail(job_id: str, path: str, max_size: int = THUMBNAIL_MAX_SIZE):
     allowed = any(is_within(candidate, root) for root in roots)
     if not allowed:
         raise HTTPException(status_code=400, detail="Path not in job directories")
-    if not candidate.exists():
+    try:
+        origin = source_origin(candidate)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
+    fmt = "webp" if WEBP_ENABLED and "image/webp" in request.headers.get("accept", "") else "jpeg"
+    mtime = origin[1]
+    key = cache_key(origin, max_size, fmt)
+    headers = {
+        # The key covers path, mtime, size and format, so it is a strong validator
+        "ETag": f'"{key}"',
+        "Last-Modified": formatdate(mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE if v == mtime else REVALIDATE_CACHE,
+        "Vary": "Accept",
+    }
+    if _not_modified(request, headers["ETag"], mtime):
+        return Response(status_code=304, headers=headers)
+    if max_size in (*REVIEW_SIZES, LIST_SIZE) and not THUMBNAILS.contains(key):
+        # The reviewer got ahead of pre-warming: move it to the group being looked at
+        group_id = STORE.group_of(job.id, path)
+        if group_id is not None:
+            PREWARM.focus(job.id, group_id)
     try:
-        data = thumbnail_bytes(candidate, max_size)
+        data = thumbnail_bytes(candidate, max_size, fmt)
     except Exception as err:  # noqa: BLE001
         logging.error("Thumbnail failed for %s: %s", candidate, err)
         raise HTTPException(status_code=500, detail="Thumbnail generation failed")
-    return Response(content=data, media_type="image/jpeg")
+    return Response(content=data, media_type=FORMATS[fmt][1], headers=headers)
@@ -10,6 +10,8 @@ def env_path(name: str, default: str | None = None) -> Path | None:
 
 
 TRASH_DIR = env_path("TRASH_DIR")
+# Files copied to a trash directory on another filesystem at once (same-filesystem moves are renames)
+TRASH_WORKERS = int(os.environ.get("TRASH_WORKERS", "4"))
 DEFAULT_WORKERS = int(os.environ.get("WORKERS", "0")) or None
 
 # Use DATA_DIR from environment, fallback to "data"
@@ -17,8 +19,27 @@ DATA_DIR = env_path("DATA_DIR") or Path("data")
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 
 # Set defaults after DATA_DIR is determined
-HASH_DB = env_path("HASH_DB") or (DATA_DIR / "hash_cache.json")
+HASH_DB = env_path("HASH_DB") or (DATA_DIR / "hash_cache.db")
 DB_PATH = env_path("DB_PATH") or (DATA_DIR / "app.db")
+STATS_DB = env_path("STATS_DB") or (DATA_DIR / "stats_cache.db")
+# Journals of files moved to a trash directory (used to undo a batch and to recover after a crash)
+TRASH_JOURNAL_DIR = DATA_DIR / "trash_journal"
+# Most recent trash batches that stay undoable; older journals are deleted on startup
+TRASH_JOURNALS_KEPT = int(os.environ.get("TRASH_JOURNALS_KEPT", "100"))
+# Loose thumbnail files from older versions; migrated into THUMBNAIL_DB on startup
 THUMBNAIL_CACHE_DIR = DATA_DIR / "thumbnails"
-THUMBNAIL_CACHE_DIR.mkdir(exist_ok=True, parents=True)
+THUMBNAIL_DB = env_path("THUMBNAIL_DB") or (DATA_DIR / "thumbnails.db")
+# Byte budget of the thumbnail cache; least recently viewed thumbnails are evicted beyond it (0: unbounded)
+THUMBNAIL_CACHE_MB = int(os.environ.get("THUMBNAIL_CACHE_MB", "2048"))
+# Background threads generating review thumbnails ahead of the reviewer (0 disables pre-warming)
+THUMBNAIL_PREWARM_WORKERS = int(os.environ.get("THUMBNAIL_PREWARM_WORKERS", "2"))
+# Serve WebP thumbnails to browsers that accept them (smaller, but slower to encode than JPEG)
+THUMBNAIL_WEBP = os.environ.get("THUMBNAIL_WEBP", "0").lower() in ("1", "true", "yes")
+# Concurrent thumbnail decodes (0: one per core, limited by physical memory)
+THUMBNAIL_DECODE_SLOTS = int(os.environ.get("THUMBNAIL_DECODE_SLOTS", "0"))
 THUMBNAIL_MAX_SIZE = int(os.environ.get("THUMBNAIL_MAX_SIZE", "640"))
+
+# Finished scans kept in the database (older ones are deleted at startup and after each scan);
+# 0 keeps every scan. JOB_MAX_AGE_DAYS additionally expires scans by age.
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", "20"))
+JOB_MAX_AGE_DAYS = float(os.environ.get("JOB_MAX_AGE_DAYS", "0")) or None
@@ -0,0 +1,65 @@
+"""
+Reduced-resolution image decoding.
+JPEGs are decoded through libjpeg's DCT scaling (Image.draft) at 1/2, 1/4 or 1/8 size whenever
+the target is small enough, and every other format is shrunk with an integer Image.reduce before
+the final resample, so a 24-megapixel photo is never fully decoded to produce a 32x32 hash input.
+This module must not import backend.config: it is loaded by process-pool hashing workers.
+"""
+
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Decode to at least this multiple of the target before the final (antialiased) resample
+REDUCING_GAP = 2.0
+# ...and never below this many pixels per side: 8x8 hash inputs need more source detail
+# than a 2x gap gives to stay within a fraction of a bit of a full decode
+MIN_DECODE_SIDE = 128
+
+LANCZOS = getattr(Image, "Resampling", Image).LANCZOS
+
+
+def _padded(size: Tuple[int, int]) -> Tuple[int, int]:
+    return tuple(max(int(side * REDUCING_GAP), MIN_DECODE_SIDE) for side in size)
+
+
+def draft(img: Image.Image, size: Tuple[int, int], mode: Optional[str] = None) -> Image.Image:
+    """
+    Ask the decoder for the smallest scale that still covers REDUCING_GAP * size.
+    Must be called before the image is loaded; a no-op for formats without draft support.
+    mode: request e.g. "L" so libjpeg skips colour conversion as well.
+    """
+    if img.format == "JPEG":
+        img.draft(mode, _padded(size))
+    return img
+
+
+def reduce_to(img: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Box-reduce by the largest integer factor that keeps the image >= REDUCING_GAP * size."""
+    width, height = _padded(size)
+    factor = min(img.width // max(1, width), img.height // max(1, height))
+    return img.reduce(factor) if factor >= 2 else img
+
+
+def decode_resized(img: Image.Image, size: Tuple[int, int], mode: str = "L") -> Image.Image:
+    """Decode `img` straight to exactly `size` (width, height) in `mode`."""
+    img = reduce_to(draft(img, size, mode), size)
+    return img.convert(mode).resize(size, LANCZOS)
+
+
+def decode_fit(img: Image.Image, max_size: int, mode: Optional[str] = None) -> Image.Image:
+    """
+    Decode `img` scaled down to fit a max_size x max_size box, keeping aspect ratio.
+    The box is square so the result is the same whether or not EXIF rotation is applied later.
+    """
+    box = (max_size, max_size)
+    img = reduce_to(draft(img, box, mode), box)
+    if mode and img.mode != mode:
+        img = img.convert(mode)
+    img.thumbnail(box, LANCZOS, reducing_gap=None)
+    # thumbnail() is a no-op for images that already fit; make sure pixels are read before
+    # the caller closes the file
+    img.load()
+    return img
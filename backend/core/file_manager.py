@@ -1,17 +1,42 @@
 """
 File movement utilities. We never hard-delete; we move to system trash or a configured directory.
+
+Moves into a trash directory are planned up front: destination directories are created and listed
+once, so names that are free are picked in memory instead of with an exists() check per file. Each
+name is then claimed with an O_EXCL placeholder before anything is moved onto it, so another job
+(or a file that appeared since) is never overwritten. Files on the trash directory's filesystem
+are renamed onto their placeholder; files on other devices are copied (to a temporary name, then
+renamed into place) and unlinked by a small pool of workers. Every move is written to an
+append-only journal before and after it happens, which is what undo and crash recovery work from.
 """
 
 from __future__ import annotations
 
+import errno
+import filecmp
+import json
 import logging
+import os
 import shutil
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from send2trash import send2trash
 
+# Moves journaled (and fsync-ed) together
+JOURNAL_BATCH = 256
+# Suffix of a cross-device copy that is not complete yet
+PARTIAL_SUFFIX = ".partial"
+# Marker next to a journal whose moves may not be settled yet (removed once they are)
+PENDING_SUFFIX = ".pending"
+# First journal entry: the trash directory of the batch (its dst), which an undo locks
+DESTINATION_OP = "destination"
+
+Progress = Callable[[int, int], None]  # (processed, total)
+
 
 class TrashConfig:
     def __init__(self, trash_dir: Optional[Path] = None, recreate_paths: bool = False) -> None:
@@ -19,33 +44,353 @@ class TrashConfig:
         self.recreate_paths = recreate_paths
 
 
-def _unique_destination(dest: Path) -> Path:
-    """If dest exists, append a short UUID suffix to avoid collisions."""
-    if not dest.exists():
-        return dest
-    stem = dest.stem
-    suffix = dest.suffix
-    parent = dest.parent
-    return parent / f"{stem}-{uuid.uuid4().hex[:6]}{suffix}"
+class TrashJournal:
+    """
+    Append-only JSON-lines record of one trash batch: a "move" entry (src -> dst) is written before
+    a file is moved and a "done" entry after ("failed" when it stayed where it was). An undo writes
+    "restoring" before moving a file back and "undone" once it is back.
+    The first entry records the trash directory the batch moves into.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @property
+    def marker(self) -> Path:
+        return self.path.with_suffix(PENDING_SUFFIX)
+
+    def begin(self, destination: Path) -> None:
+        """Record the trash directory and flag the journal for crash recovery until `settle` is called."""
+        self.marker.touch()
+        self.append(DESTINATION_OP, [("", str(destination))])
+
+    def settle(self) -> None:
+        self.marker.unlink(missing_ok=True)
+
+    def append(self, op: str, moves: Iterable[Tuple[str, str]]) -> None:
+        """Record `op` for each (src, dst) and make it durable before returning."""
+        lines = [json.dumps({"op": op, "src": src, "dst": dst}) + "\n" for src, dst in moves]
+        if lines:
+            with self._lock, self.path.open("a", encoding="utf-8") as journal:
+                journal.writelines(lines)
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def state(self) -> Dict[str, Tuple[str, str]]:
+        """src -> (last op, dst) of every move in the journal."""
+        moves: Dict[str, Tuple[str, str]] = {}
+        try:
+            with self.path.open(encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn final line of a crashed write
+                    if entry["op"] != DESTINATION_OP:
+                        moves[entry["src"]] = (entry["op"], entry["dst"])
+        except FileNotFoundError:
+            pass
+        return moves
+
+    def destination(self) -> Optional[Path]:
+        """Trash directory of the batch (None if the journal does not exist)."""
+        try:
+            with self.path.open(encoding="utf-8") as journal:
+                entry = json.loads(journal.readline() or "{}")
+        except (FileNotFoundError, ValueError):
+            return None
+        return Path(entry["dst"]) if entry.get("op") == DESTINATION_OP else None
+
+
+def pending_journals(directory: Path) -> List[TrashJournal]:
+    """Journals whose batch did not finish (the process stopped while moving files)."""
+    return [TrashJournal(marker.with_suffix(".jsonl")) for marker in sorted(directory.glob(f"*{PENDING_SUFFIX}"))]
+
+
+def prune_journals(directory: Path, keep: int) -> int:
+    """Delete all but the `keep` most recent settled journals (older batches can no longer be undone)."""
+    settled = [path for path in directory.glob("*.jsonl") if not path.with_suffix(PENDING_SUFFIX).exists()]
+    settled.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in settled[keep:]:
+        path.unlink(missing_ok=True)
+    return max(0, len(settled) - keep)
+
+
+def _suffixed(dest: Path) -> Path:
+    return dest.parent / f"{dest.stem}-{uuid.uuid4().hex[:6]}{dest.suffix}"
+
+
+def _unique_destination(dest: Path, taken: Set[str]) -> Path:
+    """If dest's name is taken in its directory, append a short UUID suffix to avoid collisions."""
+    while dest.name in taken:
+        dest = _suffixed(dest)
+    taken.add(dest.name)
+    return dest
+
+
+def _placeholder(path: Path) -> None:
+    """Atomically create an empty file at `path`; FileExistsError if anything is there."""
+    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600))
+
+
+def _claim(dest: Path) -> Path:
+    """Claim `dest`, or a suffixed name when something took it since it was planned."""
+    while True:
+        try:
+            _placeholder(dest)
+            return dest
+        except FileExistsError:
+            dest = _suffixed(dest)
+
+
+def _release(placeholder: Path) -> None:
+    """Remove a claimed name nothing was moved onto (a placeholder is the only empty file we create)."""
+    try:
+        if os.stat(placeholder).st_size == 0:
+            os.unlink(placeholder)
+    except FileNotFoundError:
+        pass
+
+
+def _copy_move(src: Path, dst: Path) -> None:
+    """Move across filesystems: `dst` (claimed) is only replaced once the copy is complete."""
+    partial = dst.with_name(dst.name + PARTIAL_SUFFIX)
+    try:
+        shutil.copy2(src, partial)
+        with open(partial, "rb") as copy:
+            os.fsync(copy.fileno())  # the source is unlinked next: the copy must survive a crash
+        os.replace(partial, dst)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    src.unlink()
+
+
+def _move(src: Path, dst: Path, same_device: bool) -> None:
+    """Move `src` onto the placeholder claimed at `dst`."""
+    if same_device:
+        try:
+            os.replace(src, dst)
+            return
+        except OSError as err:
+            if err.errno != errno.EXDEV:
+                raise
+    _copy_move(src, dst)
+
+
+def _plan(paths: List[Path], config: TrashConfig) -> Tuple[List[Tuple[Path, Path, bool]], List[Path]]:
+    """(src, dst, same device) for each file to move, and the files that are already gone."""
+    trash_dir = config.trash_dir
+    trash_dir.mkdir(parents=True, exist_ok=True)
+    trash_dev = os.stat(trash_dir).st_dev
+    names: Dict[Path, Set[str]] = {}  # destination directory -> names in use
+    moves: List[Tuple[Path, Path, bool]] = []
+    missing: List[Path] = []
+    for src in paths:
+        try:
+            dev = os.stat(src).st_dev
+        except FileNotFoundError:
+            logging.warning("File not found, skipping: %s", src)
+            missing.append(src)
+            continue
+        except OSError as err:
+            logging.error("Failed to move %s: %s", src, err)
+            continue
+        target = trash_dir / (src.relative_to(src.anchor) if config.recreate_paths else src.name)
+        taken = names.get(target.parent)
+        if taken is None:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            taken = names[target.parent] = set(os.listdir(target.parent))
+        moves.append((src, _unique_destination(target, taken), dev == trash_dev))
+    return moves, missing
 
 
-def move_to_trash(paths: Iterable[Path], config: TrashConfig) -> None:
+def _run_moves(
+    moves: List[Tuple[Path, Path, bool]],
+    journal: Optional[TrashJournal],
+    pool: ThreadPoolExecutor,
+    progress: Optional[Progress],
+    done_before: int,
+    total: int,
+) -> List[Path]:
     """
-    Move files to system trash (default) or to a provided trash directory.
+    Perform planned moves batch by batch: same-device renames inline, copies on the pool.
+    Returns the sources that were moved.
     """
-    for src in paths:
+    moved: List[Path] = []
+
+    def attempt(move: Tuple[Path, Path, bool]) -> Optional[Path]:
+        """Move one file; returns where it went, or None if it stayed."""
+        src, dst, same_device = move
         try:
-            if config.trash_dir:
-                config.trash_dir.mkdir(parents=True, exist_ok=True)
-                target = config.trash_dir / (src.relative_to(src.anchor) if config.recreate_paths else src.name)
-                target = _unique_destination(target)
-                target.parent.mkdir(parents=True, exist_ok=True)
-                logging.info("Moving %s -> %s", src, target)
-                shutil.move(str(src), str(target))
-            else:
-                logging.info("Sending to system trash: %s", src)
-                send2trash(str(src))
+            claimed = _claim(dst)
+        except OSError as err:
+            logging.error("Failed to move %s: %s", src, err)
+            return None
+        try:
+            if claimed != dst and journal:
+                journal.append("move", [(str(src), str(claimed))])
+            logging.debug("Moving %s -> %s", src, claimed)
+            _move(src, claimed, same_device)
+            return claimed
         except FileNotFoundError:
             logging.warning("File not found, skipping: %s", src)
         except Exception as err:  # noqa: BLE001
             logging.error("Failed to move %s: %s", src, err)
+        _release(claimed)
+        return None
+
+    for start in range(0, len(moves), JOURNAL_BATCH):
+        batch = moves[start : start + JOURNAL_BATCH]
+        if journal:
+            journal.append("move", ((str(src), str(dst)) for src, dst, _ in batch))
+        local = [move for move in batch if move[2]]
+        remote = [move for move in batch if not move[2]]
+        copies = pool.map(attempt, remote)
+        results = list(zip(local, map(attempt, local))) + list(zip(remote, copies))
+        done = [(src, dst) for (src, _, _), dst in results if dst is not None]
+        if journal:
+            journal.append("done", ((str(src), str(dst)) for src, dst in done))
+            journal.append("failed", ((str(src), str(dst)) for (src, dst, _), moved in results if moved is None))
+        moved.extend(src for src, _ in done)
+        if progress:
+            progress(done_before + start + len(batch), total)
+    return moved
+
+
+def move_to_trash(
+    paths: Iterable[Path],
+    config: TrashConfig,
+    journal: Optional[TrashJournal] = None,
+    progress: Optional[Progress] = None,
+    workers: int = 4,
+) -> List[Path]:
+    """
+    Move files to system trash (default) or to a provided trash directory.
+    Returns the paths that are gone from their original location (moved, or already missing).
+    Moves into a trash directory are recorded in `journal`, when given, so they can be undone.
+    """
+    paths = list(paths)
+    total = len(paths)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="trash") as pool:
+        if config.trash_dir:
+            moves, gone = _plan(paths, config)
+            if progress:
+                progress(total - len(moves), total)
+            if journal:
+                journal.begin(config.trash_dir)
+            gone.extend(_run_moves(moves, journal, pool, progress, total - len(moves), total))
+            if journal:
+                journal.settle()  # left in place if moving raised: recovery finishes the batch
+            return gone
+
+        def system_trash(src: Path) -> bool:
+            try:
+                logging.debug("Sending to system trash: %s", src)
+                send2trash(str(src))
+            except FileNotFoundError:
+                logging.warning("File not found, skipping: %s", src)
+            except Exception as err:  # noqa: BLE001
+                logging.error("Failed to move %s: %s", src, err)
+                return False
+            return True
+
+        gone = []
+        for processed, (src, ok) in enumerate(zip(paths, pool.map(system_trash, paths)), 1):
+            if ok:
+                gone.append(src)
+            if progress and (processed % JOURNAL_BATCH == 0 or processed == total):
+                progress(processed, total)
+        return gone
+
+
+def undo_trash(journal: TrashJournal, progress: Optional[Progress] = None, workers: int = 4) -> List[Path]:
+    """
+    Move every file of a journaled batch back where it came from; returns the restored paths.
+    The journal is deleted once nothing in it is left to undo.
+    """
+    pending = [
+        (Path(dst), Path(src), op) for src, (op, dst) in journal.state().items() if op in ("done", "restoring")
+    ]
+    total = len(pending)
+    restored: List[Path] = []
+
+    def restore(move: Tuple[Path, Path, str]) -> bool:
+        dst, src, op = move
+        if not dst.exists():
+            if src.exists():
+                return True  # restored by an undo that was interrupted
+            logging.error("Cannot restore %s: it is no longer in the trash", src)
+            return False
+        src.parent.mkdir(parents=True, exist_ok=True)
+        if op == "restoring":
+            _release(src)  # placeholder of an interrupted undo
+        try:
+            _placeholder(src)
+        except FileExistsError:
+            logging.error("Cannot restore %s: a file already exists there", src)
+            return False
+        try:
+            _move(dst, src, os.stat(dst).st_dev == os.stat(src.parent).st_dev)
+            return True
+        except Exception as err:  # noqa: BLE001
+            logging.error("Failed to restore %s: %s", src, err)
+            _release(src)
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="trash") as pool:
+        for start in range(0, total, JOURNAL_BATCH):
+            batch = pending[start : start + JOURNAL_BATCH]
+            journal.append("restoring", ((str(src), str(dst)) for dst, src, _ in batch))
+            results = list(zip(batch, pool.map(restore, batch)))
+            journal.append("undone", ((str(src), str(dst)) for (dst, src, _), ok in results if ok))
+            # the rest are still in the trash and can be undone again
+            journal.append("done", ((str(src), str(dst)) for (dst, src, _), ok in results if not ok))
+            restored.extend(src for (_, src, _), ok in results if ok)
+            if progress:
+                progress(start + len(batch), total)
+    if len(restored) == total:
+        journal.path.unlink(missing_ok=True)
+    return restored
+
+
+def _same_content(a: Path, b: Path) -> bool:
+    try:
+        return filecmp.cmp(a, b, shallow=False)
+    except OSError:
+        return False
+
+
+def recover_journal(journal: TrashJournal) -> List[Path]:
+    """
+    Settle moves a crash interrupted (journaled as started but not finished):
+    - the source is gone and the destination exists: the move finished;
+    - both exist with the same content: a cross-device copy finished, and the source is removed;
+    - otherwise the file never moved; its empty placeholder and any partial copy are discarded.
+    Returns the sources that are now in the trash.
+    """
+    finished: List[Tuple[str, str]] = []
+    abandoned: List[Tuple[str, str]] = []
+    for src, (op, dst) in journal.state().items():
+        if op != "move":
+            continue
+        source, target = Path(src), Path(dst)
+        target.with_name(target.name + PARTIAL_SUFFIX).unlink(missing_ok=True)
+        if target.exists() and not source.exists():
+            finished.append((src, dst))
+        elif target.exists() and _same_content(source, target):
+            source.unlink()
+            finished.append((src, dst))
+        else:
+            _release(target)
+            abandoned.append((src, dst))
+    journal.append("done", finished)
+    journal.append("failed", abandoned)
+    journal.settle()
+    if finished or abandoned:
+        logging.info(
+            "Recovered %s: %d interrupted moves finished, %d rolled back", journal.path, len(finished), len(abandoned)
+        )
+    return [Path(src) for src, _ in finished]
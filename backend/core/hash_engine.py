@@ -1,49 +1,81 @@
 """
-Hashing and grouping wrapper around the `duplicate_images` library.
-Uses pairs from duplicate_images and merges them into clusters we can act on.
+Hashing and grouping.
+The native engine walks, decodes and hashes files itself (see `hashing.py`); the
+`duplicate_images` library is kept as a fallback for algorithms we don't implement.
 """
 
 from __future__ import annotations
 
 import logging
+import os
+import queue
+import re
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Pattern,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
-from duplicate_images.duplicate import get_matches
-from duplicate_images.pair_finder_options import PairFinderOptions
+import numpy as np
+
+from backend.core.hash_index import HashIndex, hamming
+from backend.core.hash_store import FileKey, HashStore
+from backend.core.hashing import DEFAULT_HASH_SIZE, FIRST_CHUNK_SIZE, NATIVE_ALGORITHMS, hash_stream, hash_words
+from backend.core.identical import identical_sets
 
 SUPPORTED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".gif"}
+ENGINES = ("native", "library")
 
+Node = TypeVar("Node", bound=Hashable)
+# progress(phase, processed, total): phase is "walk", "hash", "verify" (cascade scans) or "group";
+# total is 0 while unknown
+ProgressCallback = Callable[[str, int, int], None]
+# Most files found by the walk that are looked up in the hash cache (and reported) together;
+# batches start at FIRST_CHUNK_SIZE and double up to this
+WALK_BATCH = 256
+# Threads listing directories during the walk (waiting on the filesystem, so more than the cores)
+WALK_WORKERS = 16
+# Cascade scans hash every file with this cheap hash first; only files with a coarse neighbour
+# are decoded again for the requested hash
+COARSE_ALGORITHM = "dhash"
+COARSE_HASH_SIZE = 8
+# Coarse bits allowed to differ between files the requested hash may still group, on top of
+# max_distance scaled to the coarse hash
+COARSE_SLACK = 8
 
-def _normalize_files(paths: Iterable[Path]) -> List[Path]:
-    """Filter to supported files and return sorted unique paths."""
-    seen: Set[Path] = set()
-    filtered: List[Path] = []
-    for p in paths:
-        if p.suffix.lower() not in SUPPORTED_EXTENSIONS:
-            continue
-        rp = p.resolve()
-        if rp in seen:
-            continue
-        seen.add(rp)
-        filtered.append(rp)
-    filtered.sort()
-    return filtered
+
+def _no_progress(phase: str, processed: int, total: int) -> None:
+    pass
 
 
-def _pairs_to_groups(pairs: Sequence[Tuple[Path, Path]]) -> List[Tuple[Path, ...]]:
+def _pairs_to_groups(pairs: Iterable[Tuple[Node, Node]]) -> List[Tuple[Node, ...]]:
     """Merge duplicate pairs into connected components (groups)."""
-    parent: Dict[Path, Path] = {}
-    size: Dict[Path, int] = {}
+    parent: Dict[Node, Node] = {}
+    size: Dict[Node, int] = {}
 
-    def find(x: Path) -> Path:
+    def find(x: Node) -> Node:
         parent.setdefault(x, x)
         if parent[x] != x:
             parent[x] = find(parent[x])
         return parent[x]
 
-    def union(a: Path, b: Path) -> None:
+    def union(a: Node, b: Node) -> None:
         ra, rb = find(a), find(b)
         if ra == rb:
             return
@@ -57,45 +89,525 @@ def _pairs_to_groups(pairs: Sequence[Tuple[Path, Path]]) -> List[Tuple[Path, ...
     for a, b in pairs:
         union(a, b)
 
-    groups: Dict[Path, List[Path]] = defaultdict(list)
+    groups: Dict[Node, List[Node]] = defaultdict(list)
     for node in parent:
         groups[find(node)].append(node)
     # ensure deterministic ordering
     return [tuple(sorted(files)) for files in groups.values() if len(files) > 1]
 
 
-def scan_and_group(
-    directories: List[Path],
-    hash_size: Optional[int] = None,
-    workers: Optional[int] = None,
-    algorithm: str = "phash",
-    hash_db: Optional[Path] = None,
-    exclude_regexes: Optional[List[str]] = None,
+def _group_equal_hashes(files: Sequence[Path], hashes: np.ndarray) -> List[Tuple[Path, ...]]:
+    """Group files whose packed hashes are bit-for-bit identical."""
+    if not len(files):
+        return []
+    _, inverse, counts = np.unique(hashes, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    buckets: Dict[int, List[Path]] = defaultdict(list)
+    for idx in np.flatnonzero(counts[inverse] > 1):
+        buckets[int(inverse[idx])].append(files[idx])
+    return sorted(tuple(sorted(group)) for group in buckets.values())
+
+
+def _group_near_hashes(
+    files: Sequence[Path], hashes: np.ndarray, nbits: int, max_distance: int
 ) -> List[Tuple[Path, ...]]:
+    """Group files whose hashes are within max_distance bits, transitively."""
+    pairs = HashIndex(hashes, nbits, max_distance).pairs()
+    logging.info("%d pairs within distance %d", len(pairs), max_distance)
+    components = _pairs_to_groups(map(tuple, pairs.tolist()))
+    return sorted(tuple(sorted(files[i] for i in comp)) for comp in components)
+
+
+class FileEntry(NamedTuple):
+    """One snapshot row: a file and the stat fields that identify its content version."""
+
+    path: Path
+    inode: int
+    size: int
+    mtime: float
+
+
+# path -> (inode, size, mtime), as persisted for a finished job
+Snapshot = Dict[str, Tuple[int, int, float]]
+
+
+@dataclass
+class PreviousScan:
+    """Snapshot and groups of an earlier job over the same directories and parameters."""
+
+    snapshot: Snapshot
+    groups: List[Tuple[str, ...]]
+
+
+@dataclass
+class ScanResult:
+    groups: List[Tuple[Path, ...]]
+    # None when the library engine did the file discovery
+    snapshot: Optional[List[FileEntry]] = None
+    # index in `groups` -> index in PreviousScan.groups, for groups whose members are all unchanged
+    reused: Dict[int, int] = field(default_factory=dict)
+    changed_files: int = 0
+    # True when the groups were patched from a PreviousScan rather than rebuilt
+    incremental: bool = False
+
+
+def _list_directory(directory: str, excluded: List[Pattern[str]]) -> Tuple[List[str], List[FileEntry]]:
     """
-    Run duplicate_images against the provided directories and return grouped tuples of similar files.
-    Groups only (no max_distance) for performance and better review UX.
-    workers: number of threads for hashing (None = library default).
+    Subdirectories of `directory` to descend into and its supported files.
+    Stat results come from the directory entries; only symlinked files are resolved.
     """
-    if not directories:
-        return []
+    subdirs: List[str] = []
+    files: List[FileEntry] = []
+    try:
+        with os.scandir(directory) as listing:
+            for entry in listing:
+                try:
+                    if entry.is_dir():
+                        # symlinked directories are not followed
+                        if not entry.is_symlink() and not any(rx.search(entry.path) for rx in excluded):
+                            subdirs.append(entry.path)
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                        continue
+                    path = os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+                    st = entry.stat()
+                except OSError as err:
+                    logging.warning("Skipping %s: %s", entry.path, err)
+                    continue
+                files.append(FileEntry(Path(path), st.st_ino, st.st_size, st.st_mtime))
+    except OSError as err:
+        logging.warning("Cannot list %s: %s", directory, err)
+    return subdirs, files
+
+
+def _walk_files(
+    directories: Iterable[Path], exclude_regexes: Optional[List[str]] = None, workers: int = WALK_WORKERS
+) -> Iterator[FileEntry]:
+    """
+    Yield supported files below `directories` as they are found, each once and in no particular
+    order. Directories are listed in parallel, and each listing queues its own subdirectories, so
+    the walk keeps going while the consumer is busy; ones matching an exclude regex are pruned
+    without being entered.
+    """
+    excluded = [re.compile(rx) for rx in exclude_regexes or []]
+    found: "queue.Queue[Optional[List[FileEntry]]]" = queue.Queue()  # None: the walk is over
+    lock = threading.Lock()
+    stopped = threading.Event()
+    seen_dirs: Set[str] = set()
+    seen_files: Set[str] = set()
+    outstanding = 0  # directories queued or being listed
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk") as pool:
+
+        def descend(subdirs: Iterable[str]) -> int:
+            nonlocal outstanding
+            with lock:
+                fresh = [d for d in subdirs if d not in seen_dirs]  # overlapping roots
+                seen_dirs.update(fresh)
+                outstanding += len(fresh)
+            for directory in fresh:
+                pool.submit(visit, directory)
+            return len(fresh)
+
+        def visit(directory: str) -> None:
+            nonlocal outstanding
+            try:
+                if not stopped.is_set():
+                    subdirs, files = _list_directory(directory, excluded)
+                    descend(subdirs)  # before this one is counted off, so the count never drops to 0 early
+                    if files:
+                        found.put(files)
+            except Exception:  # noqa: BLE001
+                if not stopped.is_set():
+                    logging.exception("Cannot list %s", directory)
+            finally:
+                with lock:
+                    outstanding -= 1
+                    last = outstanding == 0
+                if last:
+                    found.put(None)
+
+        roots = (os.path.realpath(d) for d in directories)
+        if not descend([root for root in roots if not any(rx.search(root) for rx in excluded)]):
+            return
+        try:
+            for files in iter(found.get, None):
+                for entry in files:
+                    key = str(entry.path)
+                    if key not in seen_files:  # overlapping roots, or a symlink to a file already found
+                        seen_files.add(key)
+                        yield entry
+        finally:
+            stopped.set()  # a consumer that stops early does not wait for the rest of the tree
+
+
+def _hash_entries(
+    entries: Iterable[FileEntry],
+    algorithm: str,
+    hash_size: int,
+    workers: Optional[int],
+    hash_db: Optional[Path],
+    previous: Optional[Snapshot] = None,
+    executor: str = "thread",
+    progress: ProgressCallback = _no_progress,
+    phase: str = "hash",
+) -> Tuple[List[FileEntry], np.ndarray, np.ndarray]:
+    """
+    Hash entries as they arrive, from a list or from a walk that is still running.
+    Each batch is looked up in the hash cache (except files changed since `previous`) as soon as
+    it arrives. The first cache miss of each size is hashed right away. Later misses of a size
+    already seen could be byte-identical copies: they wait for the end of the input and are
+    checked with `identical_sets`, so each set of copies is decoded once.
+    Returns the entries in arrival order, the mask of hashed ones and their hashes.
+    While the input is still open, progress reports the walk (files found so far); hashing is
+    reported once the total is known.
+    """
+    found: List[FileEntry] = []
+    parts: List[Tuple[np.ndarray, np.ndarray]] = []  # (rows, hashes) as they come in
+    eager: List[int] = []  # rows hashed while the input is open, in the order they were handed out
+    first_of_size: Dict[int, int] = {}
+    deferred: List[int] = []
+    total: Optional[int] = len(entries) if isinstance(entries, Sequence) else None
+    done = 0
+    cached_count = 0
+    store = HashStore(hash_db) if hash_db else None
+
+    def key(i: int) -> FileKey:
+        return (str(found[i].path), found[i].size, found[i].mtime)
+
+    def report() -> None:
+        if total is None:
+            progress("walk", len(found), 0)
+        else:
+            progress(phase, done, total)
+
+    def persist(rows: Sequence[int], hashes: np.ndarray) -> None:
+        nonlocal done
+        parts.append((np.asarray(rows, dtype=np.int64), hashes))
+        if store:
+            store.store(((*key(i), row.tobytes()) for i, row in zip(rows, hashes)), algorithm, hash_size)
+        done += len(rows)
+        report()
+
+    def misses() -> Iterator[Path]:
+        """Paths to hash right away, looking up each batch of arrivals in the cache first."""
+        nonlocal total, done, cached_count
+        arrivals = iter(entries)
+        step = FIRST_CHUNK_SIZE
+        while True:
+            batch = list(islice(arrivals, step))
+            if not batch:
+                break
+            step = min(WALK_BATCH, step * 2)
+            start = len(found)
+            found.extend(batch)
+            rows = range(start, len(found))
+            fresh = [i for i in rows if previous is None or previous.get(key(i)[0]) != found[i][1:]]
+            cached = store.lookup([key(i) for i in fresh], algorithm, hash_size) if store and fresh else {}
+            hits = [i for i in fresh if key(i)[0] in cached]
+            if hits:
+                blobs = b"".join(cached[key(i)[0]] for i in hits)
+                parts.append((np.asarray(hits, dtype=np.int64), np.frombuffer(blobs, dtype=np.uint64).reshape(len(hits), -1)))
+                done += len(hits)
+                cached_count += len(hits)
+            hit = set(hits)
+            for i in rows:
+                if i in hit:
+                    continue
+                size = found[i].size
+                if size and size in first_of_size:
+                    deferred.append(i)
+                    continue
+                first_of_size.setdefault(size, i)
+                eager.append(i)
+                yield found[i].path
+            report()
+        total = len(found)
+        report()
+
+    try:
+        for idx, rows in hash_stream(misses(), algorithm, hash_size, workers, executor=executor):
+            persist([eager[i] for i in idx.tolist()], rows)
+        if cached_count:
+            logging.info("%d hashes loaded from cache", cached_count)
+
+        # Byte-identical files are decoded once: only one file of each set is hashed
+        copies: Dict[int, List[int]] = {}
+        if deferred:
+            candidates = sorted({*deferred, *(first_of_size[found[i].size] for i in deferred)})
+            hashed_first = set(eager)
+            for members in identical_sets(
+                [found[i].path for i in candidates], [found[i].size for i in candidates], workers
+            ):
+                rows = [candidates[m] for m in members]
+                first = next((i for i in rows if i in hashed_first), rows[0])
+                copies[first] = [i for i in rows if i != first]
+        copied = {i for rest in copies.values() for i in rest}
+        todo = [i for i in deferred if i not in copied]
+        if copied:
+            logging.info("%d byte-identical copies share the hash of another file", len(copied))
+        for idx, rows in hash_stream([found[i].path for i in todo], algorithm, hash_size, workers, executor=executor):
+            persist([todo[i] for i in idx.tolist()], rows)
+
+        ok = np.zeros(len(found), dtype=bool)
+        hashes = np.zeros((len(found), hash_words(hash_size)), dtype=np.uint64)
+        for rows, part in parts:
+            ok[rows] = True
+            hashes[rows] = part
+        shared = [(first, rest) for first, rest in copies.items() if ok[first]]
+        for first, rest in shared:
+            ok[rest] = True
+            hashes[rest] = hashes[first]
+        if shared:
+            persist([i for _, rest in shared for i in rest], np.concatenate([hashes[rest] for _, rest in shared]))
+    finally:
+        if store:
+            store.close()
+    return found, ok, hashes
+
+
+def diff_snapshot(previous: Snapshot, entries: Sequence[FileEntry]) -> np.ndarray:
+    """Boolean mask over `entries`: True where the file is new or its inode/size/mtime changed."""
+    return np.fromiter(
+        (previous.get(str(e.path)) != (e.inode, e.size, e.mtime) for e in entries),
+        dtype=bool,
+        count=len(entries),
+    )
+
+
+def _patch_groups(
+    files: Sequence[Path],
+    hashes: np.ndarray,
+    nbits: int,
+    max_distance: int,
+    previous_groups: Sequence[Tuple[str, ...]],
+    changed: np.ndarray,
+) -> Tuple[List[Tuple[Path, ...]], Dict[int, int]]:
+    """
+    Rebuild groups from the previous job's groups plus the neighbours of changed files.
+    Untouched previous groups are carried over as-is; groups that lost members are re-checked
+    pairwise (a removed member may have bridged them); only changed files hit the index.
+    """
+    index_of = {str(p): i for i, p in enumerate(files)}
+    pairs: List[Tuple[int, int]] = []
+    intact: Dict[Tuple[int, ...], int] = {}
+    for prev_idx, members in enumerate(previous_groups):
+        rows = [index_of.get(m) for m in members]
+        alive = [i for i in rows if i is not None and not changed[i]]
+        if len(alive) < 2:
+            continue
+        if len(alive) == len(members):
+            intact[tuple(sorted(alive))] = prev_idx
+            pairs.extend((alive[0], i) for i in alive[1:])
+            continue
+        sub = np.asarray(alive)
+        dist = hamming(hashes[sub][:, None, :], hashes[sub][None, :, :])
+        a, b = np.nonzero(np.triu(dist <= max_distance, 1))
+        pairs.extend(zip(sub[a].tolist(), sub[b].tolist()))
+
+    queries = np.flatnonzero(changed)
+    if len(queries):
+        pairs.extend(map(tuple, HashIndex(hashes, nbits, max_distance).pairs(queries).tolist()))
+
+    components = sorted(tuple(sorted(comp)) for comp in _pairs_to_groups(pairs))
+    groups = [tuple(files[i] for i in comp) for comp in components]
+    reused = {n: intact[comp] for n, comp in enumerate(components) if comp in intact}
+    return groups, reused
+
+
+def _coarse_candidates(
+    entries: Sequence[FileEntry], ok: np.ndarray, coarse: np.ndarray, scaled_distance: int
+) -> List[FileEntry]:
+    """First cascade stage: the entries whose coarse hash is within reach of another one's."""
+    rows = np.flatnonzero(ok)
+    coarse_bits = COARSE_HASH_SIZE * COARSE_HASH_SIZE
+    pairs = HashIndex(coarse[rows], coarse_bits, min(scaled_distance + COARSE_SLACK, coarse_bits)).pairs()
+    candidates = rows[np.unique(pairs)]
+    logging.info("Cascade: %d of %d files have a coarse neighbour", len(candidates), len(entries))
+    return [entries[i] for i in candidates]
+
+
+def _scan_native(
+    directories: List[Path],
+    hash_size: Optional[int],
+    workers: Optional[int],
+    algorithm: str,
+    hash_db: Optional[Path],
+    exclude_regexes: Optional[List[str]],
+    max_distance: int,
+    previous: Optional[PreviousScan] = None,
+    executor: str = "thread",
+    progress: ProgressCallback = _no_progress,
+    cascade: bool = False,
+) -> ScanResult:
+    hash_size = hash_size or DEFAULT_HASH_SIZE
+    nbits = hash_size * hash_size
+    snapshot = previous.snapshot if previous else None
+    # Files are hashed while the walk is still finding more; cascade scans stream the coarse hash
+    progress("walk", 0, 0)
+    found, ok, hashes = _hash_entries(
+        _walk_files(directories, exclude_regexes),
+        COARSE_ALGORITHM if cascade else algorithm,
+        COARSE_HASH_SIZE if cascade else hash_size,
+        workers,
+        hash_db,
+        snapshot,
+        executor=executor,
+        progress=progress,
+    )
+    order = sorted(range(len(found)), key=lambda i: found[i].path)
+    entries = [found[i] for i in order]
+    ok, hashes = ok[order], hashes[order]
+    logging.info("%d candidate files", len(entries))
+    progress("hash", len(entries), len(entries))
+
+    changed = diff_snapshot(snapshot, entries) if previous else None
+    changed_files = int(changed.sum()) if changed is not None else len(entries)
+    if changed is not None:
+        logging.info("Incremental scan: %d new or modified files", changed_files)
+    hashed: Sequence[FileEntry] = entries
+    if cascade:
+        hashed = _coarse_candidates(entries, ok, hashes, max_distance * COARSE_HASH_SIZE ** 2 // nbits)
+        _, ok, hashes = _hash_entries(
+            hashed, algorithm, hash_size, workers, hash_db, snapshot, executor=executor, progress=progress, phase="verify"
+        )
+        progress("verify", len(hashed), len(hashed))
+        if changed is not None:
+            changed = diff_snapshot(snapshot, hashed)
+
+    files = [e.path for e, good in zip(hashed, ok) if good]
+    hashes = hashes[ok]
+    progress("group", 0, 0)
+    if previous:
+        groups, reused = _patch_groups(files, hashes, nbits, max_distance, previous.groups, changed[ok])
+        return ScanResult(groups, entries, reused, changed_files=changed_files, incremental=True)
+    if max_distance > 0:
+        groups = _group_near_hashes(files, hashes, nbits, max_distance)
+    else:
+        groups = _group_equal_hashes(files, hashes)
+    return ScanResult(groups, entries, changed_files=changed_files)
+
+
+def _library_store_path(hash_db: Optional[Path], algorithm: str, hash_size: Optional[int]) -> Optional[Path]:
+    """One duplicate_images JSON cache per parameter set, next to the SQLite store."""
+    if not hash_db:
+        return None
+    return hash_db.with_name(f"{hash_db.stem}-{algorithm}-{hash_size or DEFAULT_HASH_SIZE}.json")
+
+
+def _scan_library(
+    directories: List[Path],
+    hash_size: Optional[int],
+    workers: Optional[int],
+    algorithm: str,
+    hash_db: Optional[Path],
+    exclude_regexes: Optional[List[str]],
+    max_distance: int,
+) -> List[Tuple[Path, ...]]:
+    from duplicate_images.duplicate import get_matches
+    from duplicate_images.pair_finder_options import PairFinderOptions
+
+    # duplicate_images only groups exact matches; with a distance it returns
+    # pairs (via an all-pairs comparison), which we merge ourselves.
     options = PairFinderOptions(
-        max_distance=0,
+        max_distance=max_distance,
         hash_size=hash_size,
         show_progress_bars=False,
         parallel=workers,
         slow=False,
-        group=True,
+        group=max_distance == 0,
     )
-    logging.info("Starting scan for %d directories (hash_size=%s)", len(directories), hash_size)
     matches = get_matches(
         root_directories=[Path(d) for d in directories],
         algorithm=algorithm,
         options=options,
-        hash_store_path=hash_db,
+        hash_store_path=_library_store_path(hash_db, algorithm, hash_size),
         exclude_regexes=exclude_regexes,
     )
+    if max_distance > 0:
+        return _pairs_to_groups(matches)
     # matches is already grouped when group=True
-    grouped = [tuple(sorted(m)) for m in matches if len(m) > 1]
-    logging.info("Found %d groups", len(grouped))
-    return grouped
+    return [tuple(sorted(m)) for m in matches if len(m) > 1]
+
+
+def scan(
+    directories: List[Path],
+    hash_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    algorithm: str = "phash",
+    hash_db: Optional[Path] = None,
+    exclude_regexes: Optional[List[str]] = None,
+    engine: str = "native",
+    max_distance: int = 0,
+    previous: Optional[PreviousScan] = None,
+    executor: str = "thread",
+    progress: Optional[ProgressCallback] = None,
+    cascade: bool = False,
+) -> ScanResult:
+    """
+    Hash the provided directories and group similar files; see `scan_and_group`.
+    With `previous` (native engine only), only files that are new or changed since that
+    snapshot are rehashed and the previous groups are patched instead of rebuilt.
+    executor: "thread" or "process" pool for native hashing.
+    progress: called as progress(phase, processed, total) while scanning; the library
+    engine only reports the phase.
+    cascade (native engine only): hash every file with a cheap coarse hash first and compute
+    the requested hash only for files with a coarse neighbour; files without one cannot be in
+    a group in practice, and never pay for the expensive decode and hash.
+    """
+    progress = progress or _no_progress
+    if not directories:
+        return ScanResult([])
+    use_native = engine == "native" and algorithm in NATIVE_ALGORITHMS
+    logging.info(
+        "Starting %s scan for %d directories (hash_size=%s, max_distance=%d)",
+        ("incremental" if previous else "cascade" if cascade else "native") if use_native else "library",
+        len(directories),
+        hash_size,
+        max_distance,
+    )
+    if use_native:
+        result = _scan_native(
+            directories,
+            hash_size,
+            workers,
+            algorithm,
+            hash_db,
+            exclude_regexes,
+            max_distance,
+            previous=previous,
+            executor=executor,
+            progress=progress,
+            cascade=cascade,
+        )
+    else:
+        progress("hash", 0, 0)
+        result = ScanResult(
+            _scan_library(directories, hash_size, workers, algorithm, hash_db, exclude_regexes, max_distance)
+        )
+    logging.info("Found %d groups (%d carried over)", len(result.groups), len(result.reused))
+    return result
+
+
+def scan_and_group(
+    directories: List[Path],
+    hash_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    algorithm: str = "phash",
+    hash_db: Optional[Path] = None,
+    exclude_regexes: Optional[List[str]] = None,
+    engine: str = "native",
+    max_distance: int = 0,
+) -> List[Tuple[Path, ...]]:
+    """
+    Hash the provided directories and return grouped tuples of similar files.
+    max_distance: Hamming distance at which two hashes count as similar; groups are the
+    connected components of that relation (0 = identical hashes only).
+    workers: number of threads for hashing (None = library default).
+    engine: "native" for the vectorized in-house engine, "library" for duplicate_images.
+    Algorithms the native engine doesn't implement always use the library.
+    hash_db: SQLite hash cache; the library engine keeps per-parameter JSON caches beside it.
+    """
+    return scan(
+        directories, hash_size, workers, algorithm, hash_db, exclude_regexes, engine, max_distance
+    ).groups
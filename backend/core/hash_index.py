@@ -0,0 +1,150 @@
+"""
+Hamming-distance near-neighbour search over packed hashes.
+Uses a multi-index hash table: hashes are split into `max_distance + 1` disjoint bit chunks,
+so any pair within `max_distance` must agree exactly on at least one chunk (pigeonhole).
+Candidates sharing a chunk bucket are verified with blocked NumPy popcount.
+"""
+
+from __future__ import annotations
+
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Max elements (rows x candidates x words) materialized per popcount block
+BLOCK_ELEMENTS = 1 << 22
+
+if hasattr(np, "bitwise_count"):
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Per-element population count of an unsigned integer array."""
+        return np.bitwise_count(words)
+
+else:
+    _BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Per-element population count of an unsigned integer array."""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8).reshape(*words.shape, -1)
+        return _BYTE_COUNTS[as_bytes].sum(axis=-1, dtype=np.uint32)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Hamming distance between packed hashes, broadcasting over leading axes."""
+    return popcount(np.bitwise_xor(a, b)).sum(axis=-1, dtype=np.int64)
+
+
+def _row_keys(rows: np.ndarray) -> np.ndarray:
+    """Integer bucket id per row, equal rows sharing an id."""
+    rows = np.ascontiguousarray(rows)
+    if rows.shape[1] == 0:
+        return np.zeros(len(rows), dtype=np.int64)
+    void = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, inverse = np.unique(void, return_inverse=True)
+    return inverse.ravel()
+
+
+def _chunk_bounds(nbits: int, chunks: int) -> List[Tuple[int, int]]:
+    edges = np.linspace(0, nbits, chunks + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+
+class HashIndex:
+    """
+    Multi-index hash table over an (N, words) uint64 hash array.
+    Identical hashes are collapsed before indexing, so exact duplicates cost nothing extra.
+    """
+
+    def __init__(self, hashes: np.ndarray, nbits: int, max_distance: int) -> None:
+        self.max_distance = max_distance
+        self.nbits = nbits
+        unique, inverse = np.unique(hashes, axis=0, return_inverse=True)
+        self._unique = np.ascontiguousarray(unique)
+        self._inverse = inverse.ravel()
+        as_bytes = self._unique.view(np.uint8)
+        self._buckets: List[np.ndarray] = []
+        if max_distance <= 0 or len(self._unique) < 2:
+            return
+        for lo, hi in _chunk_bounds(nbits, min(max_distance + 1, nbits)):
+            # Hashes are packed MSB-first, so bit i lives in byte i // 8
+            b0, b1 = lo // 8, (hi + 7) // 8
+            bits = np.unpackbits(as_bytes[:, b0:b1], axis=1)[:, lo - 8 * b0 : hi - 8 * b0]
+            self._buckets.append(_row_keys(np.packbits(bits, axis=1)))
+
+    def _unique_pairs(self, queries: Optional[np.ndarray] = None) -> np.ndarray:
+        """Pairs (i < j) of unique-hash ids within max_distance; restricted to `queries` if given."""
+        found: List[np.ndarray] = []
+        n = len(self._unique)
+        wanted = None
+        if queries is not None:
+            wanted = np.zeros(n, dtype=bool)
+            wanted[queries] = True
+        for keys in self._buckets:
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+            ends = np.r_[starts[1:], n]
+            for start, end in zip(starts, ends):
+                if end - start < 2:
+                    continue
+                members = order[start:end]
+                if wanted is not None and not wanted[members].any():
+                    continue
+                found.extend(self._verify(members, wanted))
+        if not found:
+            return np.empty((0, 2), dtype=np.int64)
+        pairs = np.concatenate(found)
+        codes = np.unique(pairs[:, 0] * n + pairs[:, 1])
+        return np.stack([codes // n, codes % n], axis=1)
+
+    def _verify(self, members: np.ndarray, wanted: Optional[np.ndarray]) -> Iterator[np.ndarray]:
+        """Blocked popcount over all pairs inside one bucket."""
+        members = np.sort(members)
+        hashes = self._unique[members]
+        words = hashes.shape[1]
+        rows = max(1, BLOCK_ELEMENTS // max(1, len(members) * words))
+        for start in range(0, len(members) - 1, rows):
+            block = hashes[start : start + rows]
+            dist = hamming(block[:, None, :], hashes[None, :, :])
+            mask = dist <= self.max_distance
+            # keep j > i only
+            mask &= np.arange(len(members))[None, :] > (start + np.arange(len(block)))[:, None]
+            i, j = np.nonzero(mask)
+            if not len(i):
+                continue
+            pairs = np.stack([members[start + i], members[j]], axis=1)
+            if wanted is not None:
+                pairs = pairs[wanted[pairs[:, 0]] | wanted[pairs[:, 1]]]
+            yield pairs
+
+    def pairs(self, queries: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        All (i, j) pairs of original rows within max_distance, as an (P, 2) int64 array.
+        If `queries` (row indices) is given, only pairs touching a query row's hash are returned.
+        Rows with identical hashes are chained (each linked to the first), and near pairs link
+        those first rows, which is enough for grouping.
+        """
+        inverse = self._inverse
+        if not len(inverse):
+            return np.empty((0, 2), dtype=np.int64)
+        order = np.argsort(inverse, kind="stable")
+        grouped = inverse[order]
+        starts = np.r_[True, grouped[1:] != grouped[:-1]]
+        first_of = np.empty(len(self._unique), dtype=np.int64)
+        first_of[grouped[starts]] = order[starts]
+        dup = order[~starts]
+        exact = np.stack([first_of[inverse[dup]], dup], axis=1)
+
+        query_ids = None
+        if queries is not None:
+            queries = np.asarray(queries, dtype=np.int64)
+            query_ids = np.unique(inverse[queries])
+            exact = exact[np.isin(inverse[exact[:, 0]], query_ids)]
+        if self.max_distance >= self.nbits:
+            # every pair is within range: chain all distinct hashes together
+            near = np.stack([np.zeros(len(self._unique) - 1, dtype=np.int64), np.arange(1, len(self._unique))], axis=1)
+        else:
+            near = self._unique_pairs(query_ids)
+        # map unique-hash ids back to a representative original row
+        near = first_of[near]
+        return np.concatenate([exact, near]) if len(near) else exact
@@ -0,0 +1,99 @@
+"""Perceptual-hash cache in SQLite, namespaced by (algorithm, hash_size)."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from backend.core.sqlite_utils import chunked
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    hash_size INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash BLOB NOT NULL,
+    PRIMARY KEY (path, algorithm, hash_size)
+) WITHOUT ROWID;
+"""
+
+# Bump whenever native hash output changes; rows written by older versions are dropped on open
+FORMAT_VERSION = 2
+LEGACY_SUFFIXES = {".json", ".pickle"}
+
+# (path, size, mtime)
+FileKey = Tuple[str, int, float]
+
+
+class HashStore:
+    def __init__(self, path: Path) -> None:
+        if path.suffix in LEGACY_SUFFIXES:
+            # HASH_DB used to point at duplicate_images' JSON cache
+            path = path.with_suffix(".db")
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+        if version < FORMAT_VERSION:
+            self._conn.execute("DELETE FROM hashes")
+            self._conn.execute(f"PRAGMA user_version = {FORMAT_VERSION}")
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "HashStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def lookup(self, files: Sequence[FileKey], algorithm: str, hash_size: int) -> Dict[str, bytes]:
+        """Return cached hashes for files whose size and mtime are unchanged."""
+        wanted = {path: (size, mtime) for path, size, mtime in files}
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            for chunk in chunked(wanted):
+                rows = self._conn.execute(
+                    f"""
+                    SELECT path, size, mtime, hash FROM hashes
+                    WHERE algorithm = ? AND hash_size = ? AND path IN ({",".join("?" * len(chunk))})
+                    """,
+                    (algorithm, hash_size, *chunk),
+                ).fetchall()
+                for path, size, mtime, blob in rows:
+                    if wanted[path] == (size, mtime):
+                        found[path] = blob
+        return found
+
+    def store(self, rows: Iterable[Tuple[str, int, float, bytes]], algorithm: str, hash_size: int) -> None:
+        """Upsert (path, size, mtime, hash) rows into the given namespace."""
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO hashes (path, algorithm, hash_size, size, mtime, hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path, algorithm, hash_size) DO UPDATE SET
+                    size=excluded.size,
+                    mtime=excluded.mtime,
+                    hash=excluded.hash
+                """,
+                [(path, algorithm, hash_size, size, mtime, blob) for path, size, mtime, blob in rows],
+            )
+            self._conn.commit()
+
+    def namespaces(self) -> List[Tuple[str, int, int]]:
+        """(algorithm, hash_size, row count) for every namespace in the store."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT algorithm, hash_size, COUNT(*) FROM hashes GROUP BY algorithm, hash_size"
+            ).fetchall()
@@ -0,0 +1,272 @@
+"""
+Vectorized perceptual hashing.
+Images are decoded into batched grayscale NumPy arrays and hashed a whole batch at a time;
+hashes are kept as packed uint64 rows (one row per file) instead of per-file Python objects.
+"""
+
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from backend.core.decode import decode_resized
+
+DEFAULT_HASH_SIZE = 8
+DEFAULT_BATCH_SIZE = 256
+# Files per process-pool work unit; small enough to keep every core busy at the tail
+PROCESS_CHUNK_SIZE = 64
+# Size of the first batch drawn from a streamed input (see _chunks)
+FIRST_CHUNK_SIZE = 16
+EXECUTORS = ("thread", "process")
+HIGHFREQ_FACTOR = 4
+
+
+def _resize_shape(algorithm: str, hash_size: int) -> Tuple[int, int]:
+    """(width, height) each image is reduced to before hashing."""
+    if algorithm == "ahash":
+        return hash_size, hash_size
+    if algorithm == "dhash":
+        return hash_size + 1, hash_size
+    if algorithm == "dhash_vertical":
+        return hash_size, hash_size + 1
+    # phash and phash_simple work on a 4x oversampled image
+    side = hash_size * HIGHFREQ_FACTOR
+    return side, side
+
+
+def _dct_matrix(n: int, rows: Sequence[int]) -> np.ndarray:
+    """Unnormalized DCT-II basis (scipy.fftpack.dct convention) restricted to `rows`."""
+    k = np.asarray(rows, dtype=np.float64)[:, None]
+    x = np.arange(n, dtype=np.float64)[None, :]
+    return (2.0 * np.cos(np.pi * k * (2 * x + 1) / (2 * n))).astype(np.float32)
+
+
+def _ahash(pixels: np.ndarray, hash_size: int) -> np.ndarray:
+    flat = pixels.reshape(len(pixels), -1).astype(np.float32)
+    return flat > flat.mean(axis=1, keepdims=True)
+
+
+def _dhash(pixels: np.ndarray, hash_size: int) -> np.ndarray:
+    return (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(pixels), -1)
+
+
+def _dhash_vertical(pixels: np.ndarray, hash_size: int) -> np.ndarray:
+    return (pixels[:, 1:, :] > pixels[:, :-1, :]).reshape(len(pixels), -1)
+
+
+def _phash(pixels: np.ndarray, hash_size: int) -> np.ndarray:
+    # Only the top-left hash_size x hash_size DCT coefficients are kept, so
+    # the transform is computed as D @ X @ D.T with a truncated basis.
+    dct = _dct_matrix(pixels.shape[1], range(hash_size))
+    low = dct @ pixels.astype(np.float32) @ dct.T
+    flat = low.reshape(len(pixels), -1)
+    return flat > np.median(flat, axis=1, keepdims=True)
+
+
+def _phash_simple(pixels: np.ndarray, hash_size: int) -> np.ndarray:
+    dct = _dct_matrix(pixels.shape[2], range(1, hash_size + 1))
+    low = pixels[:, :hash_size, :].astype(np.float32) @ dct.T
+    flat = low.reshape(len(pixels), -1)
+    return flat > flat.mean(axis=1, keepdims=True)
+
+
+HASH_FUNCTIONS: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {
+    "ahash": _ahash,
+    "dhash": _dhash,
+    "dhash_vertical": _dhash_vertical,
+    "phash": _phash,
+    "phash_simple": _phash_simple,
+}
+# whash stays on the library engine: imagehash takes the Haar transform of the full decode scaled to
+# a power of two, which a reduced-scale decode cannot reproduce bit for bit
+NATIVE_ALGORITHMS = frozenset(HASH_FUNCTIONS)
+
+
+def hash_words(hash_size: int) -> int:
+    """Number of uint64 words needed for one hash of the given size."""
+    return (hash_size * hash_size + 63) // 64
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Pack an (N, nbits) boolean array into an (N, words) uint64 array."""
+    packed = np.packbits(bits, axis=1)
+    pad = (-packed.shape[1]) % 8
+    if pad:
+        packed = np.pad(packed, ((0, 0), (0, pad)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+
+def hash_batch(pixels: np.ndarray, algorithm: str, hash_size: int) -> np.ndarray:
+    """Hash a (N, H, W) uint8 grayscale batch, returning packed (N, words) uint64 hashes."""
+    bits = HASH_FUNCTIONS[algorithm](pixels, hash_size)
+    return pack_bits(bits)
+
+
+def load_gray(path: Path, size: Tuple[int, int]) -> Optional[np.ndarray]:
+    """
+    Decode one image to an (H, W) uint8 grayscale array of the given (width, height).
+    JPEGs are decoded at reduced scale (see `decode.py`), so large photos never decode in full.
+    """
+    try:
+        with Image.open(path) as img:
+            return np.asarray(decode_resized(img, size, "L"), dtype=np.uint8)
+    except Exception as err:  # noqa: BLE001
+        logging.warning("Failed to decode %s: %s", path, err)
+        return None
+
+
+def _hash_chunk(paths: Sequence[str], algorithm: str, hash_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Process-pool work unit: decode and hash a chunk of files.
+    Takes plain strings and returns (offsets of decoded files, packed hashes) so that only
+    compact arrays cross the process boundary.
+    """
+    size = _resize_shape(algorithm, hash_size)
+    batch = np.empty((len(paths), size[1], size[0]), dtype=np.uint8)
+    filled = []
+    for offset, path in enumerate(paths):
+        arr = load_gray(Path(path), size)
+        if arr is None:
+            continue
+        batch[len(filled)] = arr
+        filled.append(offset)
+    offsets = np.asarray(filled, dtype=np.int32)
+    if not filled:
+        return offsets, np.empty((0, hash_words(hash_size)), dtype=np.uint64)
+    return offsets, hash_batch(batch[: len(filled)], algorithm, hash_size)
+
+
+def default_process_count() -> int:
+    return os.cpu_count() or 1
+
+
+# Workers are never forked from the app: scans run on a thread of a process full of other threads
+# (SQLite connections, thumbnail and trash pools), and a fork copies their locks in whatever state
+# they are in. Where it is available they are forked from a fork server that has imported only this
+# module; frozen builds and Windows spawn them. Either way each worker also imports the main module
+# (for the app, backend.app), which opens no store or thread until the app starts.
+def _process_context() -> multiprocessing.context.BaseContext:
+    if "forkserver" in multiprocessing.get_all_start_methods() and not getattr(sys, "frozen", False):
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    # Bundled executables only handle spawned children (see freeze_support in the launcher)
+    return multiprocessing.get_context("spawn")
+
+
+def _chunks(paths: Iterable[Path], size: int) -> Iterator[Tuple[int, List[Path]]]:
+    """
+    (offset of the first path, paths) of consecutive chunks, drawn from `paths` only as needed.
+    Chunks start small and double up to `size`, so a slow producer does not hold back the first decode.
+    """
+    it = iter(paths)
+    start = 0
+    step = min(size, FIRST_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(it, step))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+        step = min(size, step * 2)
+
+
+def _stream_in_processes(
+    paths: Iterable[Path], algorithm: str, hash_size: int, workers: Optional[int]
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    workers = workers or default_process_count()
+    chunks = _chunks(paths, PROCESS_CHUNK_SIZE)
+    pending: Dict[Future, int] = {}
+    context = _process_context()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+
+        def submit_next() -> None:
+            start, chunk = next(chunks, (None, None))
+            if chunk is not None:
+                pending[executor.submit(_hash_chunk, [str(p) for p in chunk], algorithm, hash_size)] = start
+
+        # keep a bounded number of chunks in flight
+        for _ in range(workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start = pending.pop(future)
+                offsets, rows = future.result()
+                submit_next()
+                if len(offsets):
+                    yield start + offsets.astype(np.int64), rows
+
+
+def hash_stream(
+    paths: Iterable[Path],
+    algorithm: str = "phash",
+    hash_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    executor: str = "thread",
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Hash `paths` in batches, drawing paths only as they are needed, so they can come from a
+    walk that is still running. Yields (positions in `paths` of the files that decoded, their
+    packed hashes) per batch; files that fail to decode are never reported.
+    executor: "thread" decodes on a thread pool; "process" spreads chunks over a process
+    pool (workers defaults to the core count) so decoding and hashing are not bound by the GIL.
+    """
+    if algorithm not in HASH_FUNCTIONS:
+        raise ValueError(f"Unsupported native algorithm: {algorithm}")
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {executor}")
+    hash_size = hash_size or DEFAULT_HASH_SIZE
+    if executor == "process":
+        yield from _stream_in_processes(paths, algorithm, hash_size, workers)
+        return
+
+    size = _resize_shape(algorithm, hash_size)
+    batch = np.empty((batch_size, size[1], size[0]), dtype=np.uint8)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start, chunk in _chunks(paths, batch_size):
+            decoded = pool.map(lambda p: load_gray(p, size), chunk)
+            filled = []
+            for offset, arr in enumerate(decoded):
+                if arr is None:
+                    continue
+                batch[len(filled)] = arr
+                filled.append(start + offset)
+            if filled:
+                yield np.asarray(filled), hash_batch(batch[: len(filled)], algorithm, hash_size)
+
+
+def compute_hashes(
+    paths: Sequence[Path],
+    algorithm: str = "phash",
+    hash_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_batch: Optional[Callable[[np.ndarray, np.ndarray], None]] = None,
+    executor: str = "thread",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash `paths` in batches (see `hash_stream`).
+    Returns (ok, hashes): a boolean mask of files that decoded successfully and an
+    (N, words) uint64 array of hashes (rows for failed files are zero).
+    on_batch(indices, hashes) is called after each batch with the rows it produced.
+    """
+    n = len(paths)
+    ok = np.zeros(n, dtype=bool)
+    hashes = np.zeros((n, hash_words(hash_size or DEFAULT_HASH_SIZE)), dtype=np.uint64)
+    for idx, rows in hash_stream(paths, algorithm, hash_size, workers, batch_size, executor):
+        hashes[idx] = rows
+        ok[idx] = True
+        if on_batch:
+            on_batch(idx, rows)
+    return ok, hashes
@@ -0,0 +1,81 @@
+"""
+Byte-identical file detection.
+Candidates are narrowed in rounds that each read more of the file: equal size, then a digest of
+the first and last PARTIAL_BYTES, then a digest of the whole content. Only files that still share
+a bucket after the last round are identical, and most files drop out after reading a few KB.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Sequence
+
+# Bytes read from each end of a file for the partial digest
+PARTIAL_BYTES = 4096
+# Read size while computing full digests
+READ_CHUNK = 1 << 20
+
+
+def _partial_digest(path: Path, size: int) -> Optional[bytes]:
+    """Digest of the first and last PARTIAL_BYTES (the whole file when it is smaller than both)."""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            digest.update(f.read(PARTIAL_BYTES))
+            if size > 2 * PARTIAL_BYTES:
+                f.seek(-PARTIAL_BYTES, 2)
+            digest.update(f.read(PARTIAL_BYTES))
+    except OSError as err:
+        logging.debug("Cannot read %s: %s", path, err)
+        return None
+    return digest.digest()
+
+
+def _full_digest(path: Path) -> Optional[bytes]:
+    digest = hashlib.blake2b()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                digest.update(chunk)
+    except OSError as err:
+        logging.debug("Cannot read %s: %s", path, err)
+        return None
+    return digest.digest()
+
+
+def _split(
+    buckets: List[List[int]], key: Callable[[int], Optional[Hashable]], pool: ThreadPoolExecutor
+) -> List[List[int]]:
+    """Refine each bucket by `key` (computed on the pool), dropping singletons and unreadable files."""
+    candidates = [i for bucket in buckets for i in bucket]
+    keys = dict(zip(candidates, pool.map(key, candidates)))
+    refined: List[List[int]] = []
+    for bucket in buckets:
+        by_key: Dict[Hashable, List[int]] = defaultdict(list)
+        for i in bucket:
+            if keys[i] is not None:
+                by_key[keys[i]].append(i)
+        refined.extend(members for members in by_key.values() if len(members) > 1)
+    return refined
+
+
+def identical_sets(paths: Sequence[Path], sizes: Sequence[int], workers: Optional[int] = None) -> List[List[int]]:
+    """Indices into `paths` of files with identical content: one ascending list per set of two or more."""
+    by_size: Dict[int, List[int]] = defaultdict(list)
+    for i, size in enumerate(sizes):
+        if size:
+            by_size[size].append(i)
+    buckets = [members for members in by_size.values() if len(members) > 1]
+    if not buckets:
+        return []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        buckets = _split(buckets, lambda i: _partial_digest(paths[i], sizes[i]), pool)
+        # the partial digest already covered every byte of small files
+        small = [b for b in buckets if sizes[b[0]] <= 2 * PARTIAL_BYTES]
+        large = [b for b in buckets if sizes[b[0]] > 2 * PARTIAL_BYTES]
+        buckets = small + _split(large, lambda i: _full_digest(paths[i]), pool)
+    return sorted(sorted(members) for members in buckets)
@@ -0,0 +1,22 @@
+"""Helpers shared by the SQLite-backed stores."""
+
+from __future__ import annotations
+
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# SQLite's default limit on bound parameters is 999 on older builds
+SQLITE_MAX_VARIABLES = 999
+
+
+def chunked(params: Iterable[T], limit: int = SQLITE_MAX_VARIABLES // 2) -> Iterator[List[T]]:
+    """Consecutive lists of at most `limit` items (by default an IN list that leaves room for other parameters)."""
+    chunk: List[T] = []
+    for item in params:
+        chunk.append(item)
+        if len(chunk) >= limit:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,89 @@
+"""
+File-liveness index for paging through scan results.
+Instead of stat-ing every file of every group on each /groups request, the store keeps a `missing`
+flag per file and a live-member count per group, so a page is a single indexed query. Files are
+marked missing when the trash endpoints move them, when a page being served turns out to reference
+them, or by a background revalidation pass over the whole job.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.state import GroupResult, ScanJob
+from backend.storage import SQLiteStore
+
+# Minimum seconds between background revalidation passes of the same job
+REVALIDATE_INTERVAL = 300.0
+# Files stat-ed per revalidation step (written back to the store after each one)
+REVALIDATE_BATCH = 1000
+
+
+class LivenessIndex:
+    def __init__(self, store: SQLiteStore) -> None:
+        self._store = store
+        self._lock = threading.Lock()
+        # job id -> time of the last finished revalidation (0 while one is running)
+        self._validated_at: Dict[str, float] = {}
+
+    def page(
+        self, job: ScanJob, offset: int, limit: int, after: Optional[int] = None
+    ) -> Tuple[int, List[GroupResult]]:
+        """
+        (total live groups, requested page). Only the page's own files are checked on disk;
+        if any turned out to be missing the page is recomputed.
+        """
+        self._schedule_revalidation(job)
+        while True:
+            total, page = self._store.page_groups(job.id, limit, offset, after)
+            missing = [p for g in page for p in g.files if not os.path.exists(p)]
+            if not missing:
+                return total, page
+            self.mark_missing(missing)
+
+    def mark_missing(self, paths: Iterable[str], missing: bool = True) -> None:
+        self._store.mark_missing(paths, missing=missing)
+
+    def forget(self, job_id: Optional[str] = None) -> None:
+        """Drop revalidation bookkeeping for one job, or for all of them."""
+        with self._lock:
+            if job_id is None:
+                self._validated_at.clear()
+            else:
+                self._validated_at.pop(job_id, None)
+
+    def _schedule_revalidation(self, job: ScanJob) -> None:
+        if job.status in ("pending", "running"):
+            return  # its files were just stat-ed by the scan itself
+        with self._lock:
+            last = self._validated_at.get(job.id)
+            if last is not None and (last == 0 or time.time() - last < REVALIDATE_INTERVAL):
+                return
+            self._validated_at[job.id] = 0
+        threading.Thread(target=self._revalidate, args=(job.id,), daemon=True).start()
+
+    def _revalidate(self, job_id: str) -> None:
+        """Background pass: stat every file of the job and update the store."""
+        try:
+            files = self._store.job_files(job_id)
+            for start in range(0, len(files), REVALIDATE_BATCH):
+                gone: List[str] = []
+                back: List[str] = []
+                for path, missing in files[start : start + REVALIDATE_BATCH]:
+                    exists = os.path.exists(path)
+                    if missing and exists:
+                        back.append(path)
+                    elif not missing and not exists:
+                        gone.append(path)
+                self._store.mark_missing(gone)
+                self._store.mark_missing(back, missing=False)
+            logging.info("Revalidated %d files of job %s", len(files), job_id)
+        except Exception:  # noqa: BLE001
+            logging.exception("Revalidation of job %s failed", job_id)
+        finally:
+            with self._lock:
+                self._validated_at[job_id] = time.time()
@@ -0,0 +1,124 @@
+"""
+Background thumbnail pre-warming in review order.
+A single sweeper thread walks the active job's groups in id order (the order the review screen
+shows them) and has a small pool of low-priority workers generate whatever thumbnails the UI will
+request that are not cached yet. Groups are read from the store page by page, so the sweep
+follows a scan that is still streaming groups in. When the reviewer opens a page, or asks for a
+thumbnail that is still cold, the sweep restarts from that group and wraps around afterwards.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from backend.state import GroupResult, JobStore
+from backend.storage import SQLiteStore
+from backend.utils.thumbnails import LIST_SIZE, REVIEW_SIZES, warm_thumbnails
+
+# Groups handed to the workers at a time; a new focus takes effect after the current batch
+PREWARM_BATCH = 8
+# Seconds to wait for more groups while the job's scan is still running
+PREWARM_POLL = 1.0
+# Niceness of worker threads (Linux schedules threads individually)
+WORKER_NICENESS = 10
+
+
+def _lower_priority() -> None:
+    if sys.platform.startswith("linux"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+        except OSError:
+            pass
+
+
+class ThumbnailPrewarmer:
+    def __init__(self, store: SQLiteStore, jobs: JobStore, workers: int) -> None:
+        self._store = store
+        self._jobs = jobs
+        self._workers = workers
+        self._cond = threading.Condition()
+        self._job_id: Optional[str] = None
+        # Sweep position: the last group id handled, and the id the sweep started after
+        self._cursor = -1
+        self._start = -1
+        self._wrapped = False
+        self._generation = 0  # bumped by focus() and stop(), so the sweep drops batches read before
+        self._thread: Optional[threading.Thread] = None
+
+    def focus(self, job_id: str, group_id: int = 1) -> None:
+        """Warm `job_id` starting at `group_id` (then onwards, then the groups before it)."""
+        if not self._workers:
+            return
+        with self._cond:
+            self._job_id = job_id
+            self._cursor = self._start = group_id - 1
+            self._wrapped = False
+            self._generation += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sweep, name="thumbnail-prewarm", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stop(self, job_id: Optional[str] = None) -> None:
+        """Stop warming `job_id` (any job if None)."""
+        with self._cond:
+            if job_id is None or self._job_id == job_id:
+                self._job_id = None
+                self._generation += 1
+
+    def _next_batch(self) -> List[GroupResult]:
+        """The active job's next groups in sweep order; waits while there is nothing to do."""
+        while True:
+            with self._cond:
+                while self._job_id is None:
+                    self._cond.wait()
+                job_id, cursor, start, wrapped, generation = (
+                    self._job_id, self._cursor, self._start, self._wrapped, self._generation
+                )
+            # Store reads can wait on its writer: focus() and stop() must not wait behind them
+            _, groups = self._store.page_groups(job_id, PREWARM_BATCH, after=cursor)
+            if wrapped:
+                groups = [g for g in groups if g.id <= start]
+            job = None if groups else self._jobs.get(job_id)
+            with self._cond:
+                if self._generation != generation:
+                    continue  # refocused or stopped meanwhile: the batch is stale
+                if groups:
+                    self._cursor = groups[-1].id
+                    return groups
+                if job and job.status in ("pending", "running"):
+                    # caught up with a streaming scan; its next flush adds more groups
+                    self._cond.wait(PREWARM_POLL)
+                elif not wrapped and start >= 0:
+                    self._cursor, self._wrapped = -1, True
+                else:
+                    logging.info("Thumbnails of job %s are warm", job_id)
+                    self._job_id = None
+
+    def _sweep(self) -> None:
+        with ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="prewarm", initializer=_lower_priority
+        ) as pool:
+            while True:
+                groups = self._next_batch()
+                tasks = [
+                    (Path(path), REVIEW_SIZES + ((LIST_SIZE,) if path == group.suggested else ()))
+                    for group in groups
+                    for path in group.files
+                ]
+                for (path, _), result in zip(tasks, pool.map(self._warm, tasks)):
+                    if isinstance(result, Exception):
+                        logging.debug("Could not pre-warm %s: %s", path, result)
+
+    @staticmethod
+    def _warm(task: Tuple[Path, Tuple[int, ...]]):
+        try:
+            return warm_thumbnails(*task)
+        except Exception as err:  # noqa: BLE001
+            return err
@@ -3,9 +3,34 @@ from __future__ import annotations
 import threading
 import time
 import uuid
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+# Scan phases in order, with the share of the overall progress bar each one covers
+PHASES: Dict[str, Tuple[float, float]] = {
+    "pending": (0.0, 0.0),
+    "walk": (0.0, 5.0),
+    "hash": (5.0, 85.0),
+    "group": (85.0, 88.0),
+    "suggest": (88.0, 98.0),
+    "persist": (98.0, 100.0),
+    # trash jobs (moving files to the trash, or back for an undo) have a single phase
+    "trash": (0.0, 100.0),
+    "restore": (0.0, 100.0),
+}
+# Cascade scans split the hashing share between the coarse pass over every file and the
+# verify pass over the candidates it leaves
+CASCADE_PHASES: Dict[str, Tuple[float, float]] = {**PHASES, "hash": (5.0, 45.0), "verify": (45.0, 85.0)}
+# Seconds of samples used for the throughput estimate
+RATE_WINDOW = 10.0
+# While a phase's total is unknown (the walk), it shows half its share after this many items
+UNKNOWN_TOTAL_HALFWAY = 1000
+# Finished jobs whose groups are kept in memory at once (least recently used are dropped)
+RESIDENT_JOBS = 4
+# Trash jobs remembered for status requests (oldest are forgotten; their journals stay on disk)
+TRASH_JOBS_KEPT = 100
 
 
 @dataclass
@@ -16,12 +41,72 @@ class GroupResult:
     stats: Dict[str, Dict]
 
 
+class ScanProgress:
+    """
+    Live progress of a running scan: written by the scan thread, read by the events endpoint.
+    Throughput is measured over a sliding window, so cache hits that complete a burst of files
+    at once do not inflate it for long. A phase's share of the percentage covers the work left when
+    its total became known, so work done before then (hashing while the walk was running) does not
+    make the percentage jump.
+    """
+
+    def __init__(self, phases: Dict[str, Tuple[float, float]] = PHASES) -> None:
+        self._lock = threading.Lock()
+        self.phases = phases
+        self.phase = "pending"
+        self.processed = 0
+        self.total = 0
+        self._start: Optional[int] = None  # processed when the phase's total became known
+        self._samples: Deque[Tuple[float, int]] = deque()
+
+    def update(self, phase: str, processed: int, total: int) -> None:
+        now = time.time()
+        with self._lock:
+            if phase != self.phase:
+                self.phase = phase
+                self._start = None
+                self._samples.clear()
+            if total and self._start is None:
+                self._start = min(processed, total)
+            self.processed = processed
+            self.total = total
+            self._samples.append((now, processed))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW:
+                self._samples.popleft()
+
+    def snapshot(self) -> Dict:
+        """phase, processed/total, files (or groups) per second, ETA in seconds and overall percent."""
+        with self._lock:
+            rate = None
+            if len(self._samples) >= 2:
+                (t0, p0), (t1, p1) = self._samples[0], self._samples[-1]
+                elapsed = max(time.time(), t1) - t0
+                rate = (p1 - p0) / elapsed if elapsed > 0 else None
+            eta = None
+            if rate and self.total:
+                eta = max(0.0, (self.total - self.processed) / rate)
+            lo, hi = self.phases.get(self.phase, (0.0, 0.0))
+            if self.total:
+                left = self.total - self._start
+                fraction = min(1.0, (self.processed - self._start) / left) if left > 0 else 1.0
+            else:
+                fraction = self.processed / (self.processed + UNKNOWN_TOTAL_HALFWAY)
+            return {
+                "phase": self.phase,
+                "processed": self.processed,
+                "total": self.total,
+                "rate": round(rate, 1) if rate is not None else None,
+                "eta": round(eta) if eta is not None else None,
+                "progress_percent": round(lo + (hi - lo) * fraction, 1),
+            }
+
+
 @dataclass
 class ScanJob:
     id: str
     directories: List[str]
     primary_dir: Optional[str]
-    threshold: int  # Unused - max_distance is always 0 (required for --group mode)
+    threshold: int  # max Hamming distance used for grouping
     algorithm: str
     workers: Optional[int]
     hash_db: Optional[str]
@@ -30,14 +115,68 @@ class ScanJob:
     message: str = ""
     created_at: float = field(default_factory=time.time)
     finished_at: Optional[float] = None
-    groups: List[GroupResult] = field(default_factory=list)
+    group_count: int = 0
     cancel_requested: bool = False  # Flag for user-requested cancellation
+    progress: ScanProgress = field(default_factory=ScanProgress, compare=False, repr=False)  # not persisted
+
+
+@dataclass
+class TrashJob:
+    id: str
+    job_id: Optional[str]  # scan whose files are moved (None for an undo of a job no longer kept)
+    kind: str  # "trash", or "undo" of an earlier trash job
+    journal: Optional[str]  # journal of the moves (None for the system trash, which has its own undo)
+    status: str = "pending"
+    message: str = ""
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    moved: int = 0
+    failed: int = 0
+    progress: ScanProgress = field(default_factory=ScanProgress, compare=False, repr=False)
+
+
+class TrashJobStore:
+    def __init__(self, max_kept: int = TRASH_JOBS_KEPT) -> None:
+        self._jobs: "OrderedDict[str, TrashJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_kept = max_kept
+
+    def create(self, **kwargs) -> TrashJob:
+        job = TrashJob(id=str(uuid.uuid4()), **kwargs)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_kept:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, trash_id: str) -> Optional[TrashJob]:
+        with self._lock:
+            return self._jobs.get(trash_id)
+
+    def active(self) -> List[TrashJob]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status in ("pending", "running")]
 
 
 class JobStore:
-    def __init__(self, initial: Optional[List[ScanJob]] = None) -> None:
+    """
+    Job headers for every known job; groups are loaded on demand through `loader` and only
+    the RESIDENT_JOBS most recently used jobs keep theirs in memory. A running scan's groups
+    are pinned while it publishes them.
+    """
+
+    def __init__(
+        self,
+        initial: Optional[List[ScanJob]] = None,
+        loader: Optional[Callable[[str], List[GroupResult]]] = None,
+        max_resident: int = RESIDENT_JOBS,
+    ) -> None:
         self._jobs: Dict[str, ScanJob] = {job.id: job for job in initial or []}
         self._lock = threading.Lock()
+        self.loader = loader
+        self.max_resident = max_resident
+        self._resident: "OrderedDict[str, List[GroupResult]]" = OrderedDict()
+        self._pinned: Dict[str, List[GroupResult]] = {}
 
     def create(self, **kwargs) -> ScanJob:
         job = ScanJob(id=str(uuid.uuid4()), **kwargs)
@@ -56,10 +195,48 @@ class JobStore:
     def reset(self, initial: Optional[List[ScanJob]] = None) -> None:
         with self._lock:
             self._jobs = {job.id: job for job in initial or []}
+            self._resident.clear()
+            self._pinned.clear()
 
     def all(self) -> List[ScanJob]:
         with self._lock:
             return list(self._jobs.values())
 
+    def discard(self, job_ids: Iterable[str]) -> None:
+        """Forget jobs (and their cached groups) that were deleted from the store."""
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs.pop(job_id, None)
+                self._resident.pop(job_id, None)
+                self._pinned.pop(job_id, None)
+
+    def groups(self, job: ScanJob) -> List[GroupResult]:
+        """Every group of a job: the live list while its scan publishes them, else from the loader."""
+        with self._lock:
+            if job.id in self._pinned:
+                return self._pinned[job.id]
+            if job.id in self._resident:
+                self._resident.move_to_end(job.id)
+                return self._resident[job.id]
+        groups = self.loader(job.id) if self.loader else []
+        with self._lock:
+            self._resident[job.id] = groups
+            self._resident.move_to_end(job.id)
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+        return groups
+
+    def pin_groups(self, job_id: str, groups: List[GroupResult]) -> None:
+        """Serve `groups` (still being appended to by the scan) until unpin_groups."""
+        with self._lock:
+            self._pinned[job_id] = groups
+            self._resident.pop(job_id, None)
+
+    def unpin_groups(self, job_id: str) -> None:
+        """Drop a finished scan's groups from memory; later reads go through the loader."""
+        with self._lock:
+            self._pinned.pop(job_id, None)
+
 
 JOB_STORE = JobStore()
+TRASH_JOBS = TrashJobStore()
@@ -33,6 +33,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const btnRemoveDir = document.getElementById('btnRemoveDir');
     const algorithmInput = document.getElementById('algorithm');
     const hashSizeInput = document.getElementById('hashSize');
+    const maxDistanceInput = document.getElementById('maxDistance');
     const btnStartScan = document.getElementById('btnStartScan');
     const btnStopScan = document.getElementById('btnStopScan');
     const btnGoReview = document.getElementById('btnGoReview');
@@ -41,7 +42,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const scanProgressFill = document.getElementById('scanProgressFill');
     const scanProgressText = document.getElementById('scanProgressText'); // New DOM element
     const workersInput = document.getElementById('workers');
+    const executorInput = document.getElementById('executor');
     const enableSharpnessCheck = document.getElementById('enableSharpnessCheck'); // New DOM element
+    const incrementalScan = document.getElementById('incrementalScan');
+    const cascadeScan = document.getElementById('cascadeScan');
 
     // --- DOM Elements (Review Screen) ---
     const screenScanSetup = document.getElementById('screen-scan-setup');
@@ -66,6 +70,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const btnPrevGroup = document.getElementById('btnPrevGroup'); // New DOM element
     const btnNextGroup = document.getElementById('btnNextGroup'); // New DOM element
     const btnFinalize = document.getElementById('btnFinalize');
+    const btnUndoTrash = document.getElementById('btnUndoTrash');
     const finalizeModal = document.getElementById('finalizeModal');
     const finalizeMessage = document.getElementById('finalizeMessage');
     const unreviewedWarning = document.getElementById('unreviewedWarning');
@@ -102,13 +107,62 @@ document.addEventListener('DOMContentLoaded', () => {
     let magnifiedImagePath = null;
     let magnifiedImageIndex = -1; // Index of the currently magnified image within selectedGroup.files
 
+    // Thumbnail URL; the file's version (mtime) lets the browser cache it without revalidating
+    function thumbnailUrl(path, maxSize) {
+        const version = fileVersions.get(path);
+        return `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(path)}&max_size=${maxSize}` + (version ? `&v=${version}` : '');
+    }
+
+    // One contact sheet request per group instead of one thumbnail request per file
+    function loadGroupSheet(group) {
+        const key = `${currentJobId}:${group.id}`;
+        if (!groupSheets.has(key)) {
+            groupSheets.set(key, fetch(`/api/groups/${group.id}/sheet?job_id=${currentJobId}&max_size=128`)
+                .then(async response => {
+                    if (!response.ok) return null;
+                    const form = await response.formData();
+                    const cells = JSON.parse(form.get('map'));
+                    const blob = form.get('sheet');
+                    const bitmap = await createImageBitmap(blob);
+                    const sheet = { url: URL.createObjectURL(blob), width: bitmap.width, height: bitmap.height, cells };
+                    bitmap.close();
+                    return sheet;
+                })
+                .catch(() => null));
+        }
+        return groupSheets.get(key);
+    }
+
+    function clearGroupSheets() {
+        groupSheets.forEach(promise => promise.then(sheet => sheet && URL.revokeObjectURL(sheet.url)));
+        groupSheets.clear();
+    }
+
+    // Fill a thumbnail tile like object-cover would: from the group's contact sheet, else its own thumbnail
+    function showThumbnail(tile, group, file) {
+        loadGroupSheet(group).then(sheet => {
+            const cell = sheet && sheet.cells[file];
+            if (!cell) {
+                tile.style.backgroundImage = `url("${thumbnailUrl(file, 128)}")`;
+                tile.style.backgroundSize = 'cover';
+                tile.style.backgroundPosition = 'center';
+                return;
+            }
+            const [x, y, width, height] = cell;
+            const scale = THUMB_TILE / Math.min(width, height);
+            tile.style.backgroundImage = `url("${sheet.url}")`;
+            tile.style.backgroundSize = `${sheet.width * scale}px ${sheet.height * scale}px`;
+            tile.style.backgroundPosition = `${-(x * scale + (width * scale - THUMB_TILE) / 2)}px ${-(y * scale + (height * scale - THUMB_TILE) / 2)}px`;
+        });
+    }
+
     // --- Functions for Magnify Mode ---
     function openMagnifiedImage(imagePath) {
         if (!selectedGroup) return; // Ensure a group is selected
 
         magnifiedImagePath = imagePath;
         magnifiedImageIndex = selectedGroup.files.indexOf(imagePath);
-        originalImageSrc.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(magnifiedImagePath)}&max_size=2048`; // Use thumbnail as fallback for full image
+        originalImageSrc.src = thumbnailUrl(magnifiedImagePath, 2048); // Use thumbnail as fallback for full image
         originalImageViewerModal.style.display = 'flex';
         
         let indexText = `${magnifiedImageIndex + 1}/${selectedGroup.files.length}`;
@@ -163,6 +217,10 @@ document.addEventListener('DOMContentLoaded', () => {
     let selectedImage = null;
     let decisions = new Map(); // { groupId: Set<string> of paths to keep }
     let visitedGroups = new Set(); // To track reviewed groups
+    let lastTrashId = null; // Trash job that can still be undone (moves to a trash directory only)
+    const fileVersions = new Map(); // path -> mtime from the loaded groups' stats
+    const groupSheets = new Map(); // "jobId:groupId" -> promise of the group's contact sheet (null: unavailable)
+    const THUMB_TILE = 92; // thumbnail row tiles: h-24 w-24 minus the 2px border
     let isSideBySideView = false; // New state for side-by-side view
     let currentFilter = 'all'; // New state for filtering groups
     let currentSortBy = 'id'; // New state for sorting groups ('id', 'image_count', 'decision_status')
@@ -506,8 +564,12 @@ document.addEventListener('DOMContentLoaded', () => {
             directories: directories,
             algorithm: algorithmInput.value,
             hash_size: parseInt(hashSizeInput.value, 10),
+            max_distance: maxDistanceInput.value ? parseInt(maxDistanceInput.value, 10) : 0,
             workers: workersInput.value ? parseInt(workersInput.value, 10) : null,
+            executor: executorInput.value,
             enable_sharpness_check: enableSharpnessCheck.checked,
+            incremental: incrementalScan.checked,
+            cascade: cascadeScan.checked,
         };
 
         stopRequested = false; // Reset stop flag for new scan
@@ -549,7 +611,7 @@ document.addEventListener('DOMContentLoaded', () => {
             renderDirs();
             hideValidationError();
 
-            pollStatus(currentJobId);
+            watchScan(currentJobId);
 
         } catch (error) {
             btnStartScan.disabled = false; // Always re-enable start scan button
@@ -595,6 +657,58 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    const PHASE_LABELS = {
+        walk: 'Finding files',
+        hash: 'Hashing',
+        verify: 'Verifying candidates',
+        group: 'Grouping',
+        suggest: 'Scoring groups',
+        persist: 'Saving results',
+    };
+
+    function formatFileSize(bytes) {
+        const units = ['B', 'KB', 'MB', 'GB'];
+        let value = bytes;
+        let unit = 0;
+        while (value >= 1024 && unit < units.length - 1) {
+            value /= 1024;
+            unit++;
+        }
+        return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+    }
+
+    function formatEta(seconds) {
+        if (seconds === null || seconds === undefined) return '';
+        const h = Math.floor(seconds / 3600);
+        const m = Math.floor((seconds % 3600) / 60);
+        const s = seconds % 60;
+        if (h) return `${h}h ${m}m`;
+        if (m) return `${m}m ${s}s`;
+        return `${s}s`;
+    }
+
+    // Follow a scan through the server-sent events stream; fall back to polling if it is unavailable
+    function watchScan(jobId) {
+        if (!window.EventSource) {
+            pollStatus(jobId);
+            return;
+        }
+        const source = new EventSource(`/api/scan/${jobId}/events`);
+        const onEvent = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.status !== 'running' && data.status !== 'pending') {
+                source.close();
+            }
+            handleStatus(jobId, data, false);
+        };
+        source.addEventListener('progress', onEvent);
+        source.addEventListener('done', onEvent);
+        source.onerror = () => {
+            source.close();
+            pollStatus(jobId);
+        };
+    }
+
     async function pollStatus(jobId) {
         try {
             const response = await fetch(`/api/scan/${jobId}`);
@@ -602,15 +716,16 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error('Could not fetch scan status.');
             }
             const data = await response.json();
+            handleStatus(jobId, data, true);
+        } catch (error) {
+            handleStatusError(error);
+        }
+    }
 
-            // Calculate a more meaningful progress if possible, otherwise use simulation
-            let progress = data.progress_percent !== undefined ? data.progress_percent : 0;
-            if (data.status === 'pending') {
-                progress = 5;
-            } else if (data.status === 'running' && data.progress_percent === undefined) {
-                // Fallback for simple progress simulation if backend doesn't send progress_percent
-                progress = 20 + Math.min(data.groups / 100 * 50, 75); // rough estimate
-            } else if (data.status === 'succeeded' || data.status === 'failed' || data.status === 'cancelled') {
+    function handleStatus(jobId, data, polling) {
+        try {
+            let progress = data.progress_percent || 0;
+            if (data.status === 'succeeded' || data.status === 'failed' || data.status === 'cancelled') {
                 progress = 100;
             }
             
@@ -620,8 +735,20 @@ document.addEventListener('DOMContentLoaded', () => {
             // Don't overwrite "Requesting scan stop..." message while waiting for cancellation
             if (!stopRequested) {
                 let statusMessage = `Status: ${data.status}`;
-                if (data.status === 'running') {
-                    statusMessage += ` | Images Hashed: ${data.hashed_images || 0}/${data.total_images || '?'}`;
+                if (data.status === 'running' && PHASE_LABELS[data.phase]) {
+                    const unit = data.phase === 'suggest' ? 'groups' : 'files';
+                    statusMessage += ` | ${PHASE_LABELS[data.phase]}`;
+                    if (data.total) {
+                        statusMessage += `: ${data.processed}/${data.total} ${unit}`;
+                    } else if (data.processed) {
+                        statusMessage += `: ${data.processed} ${unit}`;
+                    }
+                    if (data.rate) {
+                        statusMessage += ` | ${data.rate} ${unit}/s`;
+                    }
+                    if (data.eta !== null && data.eta !== undefined) {
+                        statusMessage += ` | ETA ${formatEta(data.eta)}`;
+                    }
                 }
                 if (data.groups !== undefined) {
                     statusMessage += ` | Groups Found: ${data.groups}`;
@@ -631,7 +758,14 @@ document.addEventListener('DOMContentLoaded', () => {
 
 
             if (data.status === 'running' || data.status === 'pending') {
-                setTimeout(() => pollStatus(jobId), 2000); // Poll every 2 seconds
+                // Scored groups are available while the scan is still running
+                if (data.groups > 0 && btnGoReview.disabled) {
+                    btnGoReview.disabled = false;
+                    updateGoReviewVisibility();
+                }
+                if (polling) {
+                    setTimeout(() => pollStatus(jobId), 2000); // Poll every 2 seconds
+                }
             } else if (data.status === 'succeeded') {
                 stopRequested = false; // Reset flag
 
@@ -704,24 +838,28 @@ document.addEventListener('DOMContentLoaded', () => {
                 scanProgressFill.classList.remove('transition-all'); // Remove transition on error
             }
         } catch (error) {
-            stopRequested = false; // Reset flag
-            hideStoppingScanAlert(); // Hide stopping alert
-            scanStatusEl.textContent = `Error polling: ${error.message}`;
-            btnStartScan.disabled = false;
-            btnStopScan.style.display = 'none'; // Hide stop button
-
-            // Restore last successful scan if available
-            if (lastSuccessfulJobId) {
-                currentJobId = lastSuccessfulJobId;
-                btnGoReview.disabled = false;
-                updateGoReviewVisibility(); // Show Go to Review button for last successful scan
-            } else {
-                btnGoReview.disabled = true;
-                btnGoReview.style.display = 'none';
-            }
+            handleStatusError(error);
+        }
+    }
 
-            scanProgressFill.classList.remove('transition-all'); // Remove transition on error
+    function handleStatusError(error) {
+        stopRequested = false; // Reset flag
+        hideStoppingScanAlert(); // Hide stopping alert
+        scanStatusEl.textContent = `Error polling: ${error.message}`;
+        btnStartScan.disabled = false;
+        btnStopScan.style.display = 'none'; // Hide stop button
+
+        // Restore last successful scan if available
+        if (lastSuccessfulJobId) {
+            currentJobId = lastSuccessfulJobId;
+            btnGoReview.disabled = false;
+            updateGoReviewVisibility(); // Show Go to Review button for last successful scan
+        } else {
+            btnGoReview.disabled = true;
+            btnGoReview.style.display = 'none';
         }
+
+        scanProgressFill.classList.remove('transition-all'); // Remove transition on error
     }
 
     function showScanSetupScreen() {
@@ -743,6 +881,11 @@ document.addEventListener('DOMContentLoaded', () => {
         if(response.ok) {
             const data = await response.json();
             allGroups = data.groups; // Store all fetched groups
+            fileVersions.clear();
+            clearGroupSheets();
+            allGroups.forEach(group => Object.entries(group.stats || {}).forEach(([path, meta]) => {
+                if (meta && meta.mtime) fileVersions.set(path, meta.mtime);
+            }));
             currentJobDirectories = data.directories || []; // Store job directories for finalize modal
             decisions = new Map(); // Reset decisions
             visitedGroups = new Set(); // Reset visited groups
@@ -795,12 +938,12 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
 
-            const thumbnailUrl = group.suggested ? `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(group.suggested)}&max_size=64` : '';
+            const iconUrl = group.suggested ? thumbnailUrl(group.suggested, 64) : '';
             const isGroupSuggested = group.suggested;
 
             div.innerHTML = `
                 <div class="flex items-center space-x-2">
-                    ${thumbnailUrl ? `<img src="${thumbnailUrl}" class="w-8 h-8 object-cover rounded" alt="Thumbnail">` : ''}
+                    ${iconUrl ? `<img src="${iconUrl}" class="w-8 h-8 object-cover rounded" alt="Thumbnail">` : ''}
                     <div class="flex-grow">
                         <div class="flex items-center space-x-2">
                             <span>Group ${group.id} (${group.files.length} images)</span>
@@ -883,7 +1026,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 imgContainer.className = 'side-by-side-img-container flex flex-col items-center h-full p-2 rounded-md bg-black border border-gray-700';
 
                 const img = document.createElement('img');
-                img.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(file)}&max_size=1024`;
+                img.src = thumbnailUrl(file, 1024);
                 img.alt = file;
                 img.className = 'w-full h-full object-contain rounded-md bg-transparent'; // object-contain for vertical fitting
 
@@ -914,7 +1057,7 @@ document.addEventListener('DOMContentLoaded', () => {
             // Existing single image view logic
             const img = document.createElement('img');
             img.id = 'heroImg';
-            img.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(selectedImage)}&max_size=1024`;
+            img.src = thumbnailUrl(selectedImage, 1024);
             img.alt = 'Selected image';
             // CHANGED: Removed 'h-full' to allow proper flex behavior
             img.className = 'max-w-full max-h-full object-contain rounded-md bg-transparent';
@@ -923,7 +1066,10 @@ document.addEventListener('DOMContentLoaded', () => {
             let heroText = selectedImage;
             const imageStats = selectedGroup.stats[selectedImage];
             if (imageStats) {
-                heroText += ` | ${imageStats.width}x${imageStats.height} | ${imageStats.size}`;
+                heroText += ` | ${imageStats.width}x${imageStats.height}`;
+                if (imageStats.size) {
+                    heroText += ` | ${formatFileSize(imageStats.size)}`;
+                }
             }
             heroTextEl.innerHTML = heroText;
         }
@@ -935,9 +1081,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const thumbContainer = document.createElement('div');
             thumbContainer.className = 'flex flex-col items-center space-y-1 mx-2 py-3'; // Container for image and tag
 
-            const img = document.createElement('img');
-            img.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(file)}&max_size=128`;
-            img.className = 'h-24 w-24 object-cover rounded-md cursor-pointer border-2 transition-all duration-200';
+            const img = document.createElement('div');
+            img.className = 'h-24 w-24 bg-no-repeat bg-gray-800 rounded-md cursor-pointer border-2 transition-all duration-200';
+            showThumbnail(img, selectedGroup, file);
             
             const isThumbKept = keptPaths.has(file);
             const isThumbSuggested = file === selectedGroup.suggested;
@@ -1158,6 +1304,26 @@ document.addEventListener('DOMContentLoaded', () => {
                     recreate_paths: false
                 };
 
+                // Dry run first: nothing is moved until the plan is confirmed
+                const planResponse = await fetch('/api/actions/trash-non-primary/plan', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(payload)
+                });
+                if (!planResponse.ok) {
+                    const error = await planResponse.json();
+                    throw new Error(error.detail || 'Failed to plan trash');
+                }
+                const plan = await planResponse.json();
+                if (plan.files === 0) {
+                    finalizeModal.style.display = 'none';
+                    alert('No files to trash.');
+                    return;
+                }
+                if (!confirm(`Trash ${plan.files} files (${formatFileSize(plan.bytes)}) from ${plan.groups} groups, keeping ${plan.kept} files in the primary directory?`)) {
+                    return;
+                }
+
                 const response = await fetch('/api/actions/trash-non-primary', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
@@ -1169,10 +1335,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     throw new Error(error.detail || 'Failed to trash files');
                 }
 
-                finalizeModal.style.display = 'none';
-                alert(`Files moved to trash successfully.`);
-                loadGroups();
-                visitedGroups.clear();
+                await finishTrash(await response.json());
                 return;
             }
 
@@ -1200,14 +1363,82 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error('Failed to move files to trash');
             }
 
-            finalizeModal.style.display = 'none';
-            alert(`${toTrash.length} files moved to trash.`);
-            loadGroups();
-            visitedGroups.clear();
+            await finishTrash(await response.json());
 
         } catch (error) {
             finalizeModal.style.display = 'none';
             alert(`Failed to move files to trash: ${error.message}`);
+        } finally {
+            optApplyDecision.disabled = false;
+            optCancelFinalize.disabled = false;
+        }
+    }
+
+    function formatTrashProgress(data) {
+        const verb = data.kind === 'undo' ? 'Restoring files' : 'Moving files to trash';
+        let text = `${verb}: ${data.processed}/${data.total}`;
+        if (data.rate) {
+            text += ` | ${data.rate} files/s`;
+        }
+        if (data.eta !== null && data.eta !== undefined) {
+            text += ` | ETA ${formatEta(data.eta)}`;
+        }
+        return text;
+    }
+
+    // Poll a trash (or undo) job until it finishes; returns its final status
+    async function followTrashJob(data, onProgress) {
+        while (data.status === 'pending' || data.status === 'running') {
+            onProgress(data);
+            await new Promise(resolve => setTimeout(resolve, 500));
+            const response = await fetch(`/api/actions/trash/${data.trash_id}`);
+            if (!response.ok) {
+                throw new Error('Could not fetch trash progress.');
+            }
+            data = await response.json();
+        }
+        if (data.status === 'failed') {
+            throw new Error(data.message || 'Trash job failed');
+        }
+        return data;
+    }
+
+    // Show a started trash job's progress in the finalize modal, then reload the groups
+    async function finishTrash(data) {
+        optApplyDecision.disabled = true;
+        optCancelFinalize.disabled = true;
+        const result = await followTrashJob(data, (progress) => {
+            finalizeMessage.textContent = formatTrashProgress(progress);
+        });
+        finalizeModal.style.display = 'none';
+        lastTrashId = result.undoable ? result.trash_id : null;
+        btnUndoTrash.style.display = lastTrashId ? 'inline-block' : 'none';
+        alert(`${result.message}.`);
+        loadGroups();
+        visitedGroups.clear();
+    }
+
+    async function undoLastTrash() {
+        if (!lastTrashId || !confirm('Move the files of the last trash operation back where they were?')) return;
+        btnUndoTrash.disabled = true;
+        try {
+            const response = await fetch(`/api/actions/trash/${lastTrashId}/undo`, { method: 'POST' });
+            if (!response.ok) {
+                const error = await response.json();
+                throw new Error(error.detail || 'Failed to undo trash');
+            }
+            const result = await followTrashJob(await response.json(), (progress) => {
+                btnUndoTrash.textContent = `Restoring ${Math.round(progress.progress_percent)}%`;
+            });
+            lastTrashId = null;
+            btnUndoTrash.style.display = 'none';
+            alert(`${result.message}.`);
+            loadGroups();
+        } catch (error) {
+            alert(`Failed to undo trash: ${error.message}`);
+        } finally {
+            btnUndoTrash.disabled = false;
+            btnUndoTrash.textContent = 'Undo Trash';
         }
     }
 
@@ -1436,6 +1667,7 @@ document.addEventListener('DOMContentLoaded', () => {
     actTrashNonSuggested.addEventListener('click', trashNonSuggested);
 
     btnFinalize.addEventListener('click', finalizePrompt);
+    btnUndoTrash.addEventListener('click', undoLastTrash);
 
     // Finalize modal buttons
     optCancelFinalize.addEventListener('click', () => {
@@ -1505,7 +1737,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         magnifiedImageIndex--;
                         magnifiedImagePath = selectedGroup.files[magnifiedImageIndex];
                         selectedImage = magnifiedImagePath;
-                        originalImageSrc.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(magnifiedImagePath)}&max_size=2048`; // Use thumbnail as fallback
+                        originalImageSrc.src = thumbnailUrl(magnifiedImagePath, 2048); // Use thumbnail as fallback
                         let indexText = `${magnifiedImageIndex + 1}/${selectedGroup.files.length}`;
                         if (magnifiedImagePath === selectedGroup.suggested) {
                             magnifiedImageIndexDisplay.innerHTML = `${indexText} <span class="suggested-dot bg-teal-500 rounded-full w-2 h-2 ml-1 inline-block"></span>`;
@@ -1520,7 +1752,7 @@ document.addEventListener('DOMContentLoaded', () => {
                         magnifiedImageIndex++;
                         magnifiedImagePath = selectedGroup.files[magnifiedImageIndex];
                         selectedImage = magnifiedImagePath;
-                        originalImageSrc.src = `/api/thumbnail?job_id=${currentJobId}&path=${encodeURIComponent(magnifiedImagePath)}&max_size=2048`; // Use thumbnail as fallback
+                        originalImageSrc.src = thumbnailUrl(magnifiedImagePath, 2048); // Use thumbnail as fallback
                         let indexText = `${magnifiedImageIndex + 1}/${selectedGroup.files.length}`;
                         if (magnifiedImagePath === selectedGroup.suggested) {
                             magnifiedImageIndexDisplay.innerHTML = `${indexText} <span class="suggested-dot bg-teal-500 rounded-full w-2 h-2 ml-1 inline-block"></span>`;
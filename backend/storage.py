@@ -1,14 +1,66 @@
 from __future__ import annotations
 
 import json
+import logging
+import os
 import sqlite3
 import threading
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
 from backend.config import DB_PATH
+from backend.core.sqlite_utils import chunked
 from backend.state import GroupResult, ScanJob
 
+# Groups written per transaction; the store lock is released between batches
+WRITE_BATCH = 1000
+# Per-file columns of the stats record returned with each group
+STAT_COLUMNS = ("size", "mtime", "width", "height", "exif_count", "sharpness")
+# compact() rewrites the file (VACUUM) once this share of its pages is free
+VACUUM_FREE_RATIO = 0.25
+# Read-only connections kept open for concurrent queries; all writes share one connection
+READ_POOL_SIZE = 4
+# Prepared statements cached per connection (the sqlite3 default is 128)
+STATEMENT_CACHE = 256
+PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",  # WAL is still crash-safe; only the last commits can be lost on power failure
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",  # KiB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+)
+
+
+def _placeholders(values: Sequence) -> str:
+    return ",".join("?" * len(values))
+
+
+def _stats_record(row: Sequence) -> Dict:
+    """files row (STAT_COLUMNS order) -> the image_stats record the API returns."""
+    meta = dict(zip(STAT_COLUMNS, row))
+    if meta["width"] is None:
+        return {}
+    meta["pixels"] = meta["width"] * meta["height"]
+    return meta
+
+
+# Live members of a job's groups, flagged when they lie inside a root directory. Everything under
+# a directory sorts between "<root>/" and "<root>0" (the character after the separator), so the
+# test is a range comparison on the path rather than a walk over its parents.
+_ROOT_MEMBERS = """
+    SELECT m.group_index, f.path, f.size, f.path >= :low AND f.path < :high AS inside
+    FROM group_members m JOIN files f ON f.id = m.file_id
+    WHERE m.job_id = :job_id AND f.missing = 0
+"""
+
+
+def _root_args(job_id: str, root: str) -> Dict[str, str]:
+    prefix = root.rstrip(os.sep) + os.sep
+    return {"job_id": job_id, "low": prefix, "high": prefix[:-1] + chr(ord(os.sep) + 1)}
+
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS jobs (
     id TEXT PRIMARY KEY,
@@ -23,48 +75,209 @@ CREATE TABLE IF NOT EXISTS jobs (
     message TEXT,
     created_at REAL,
     finished_at REAL,
-    cancel_requested INTEGER DEFAULT 0
+    cancel_requested INTEGER DEFAULT 0,
+    group_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime REAL,
+    width INTEGER,
+    height INTEGER,
+    exif_count INTEGER,
+    sharpness REAL,
+    missing INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE IF NOT EXISTS groups (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
     job_id TEXT NOT NULL,
     group_index INTEGER NOT NULL,
-    files TEXT NOT NULL,
-    suggested TEXT,
-    stats TEXT,
+    suggested_id INTEGER REFERENCES files(id),
+    live INTEGER NOT NULL,  -- members whose file is not known to be missing
+    PRIMARY KEY (job_id, group_index),
     FOREIGN KEY(job_id) REFERENCES jobs(id) ON DELETE CASCADE
-);
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_groups_live ON groups(job_id, group_index) WHERE live > 0;
+
+CREATE TABLE IF NOT EXISTS group_members (
+    job_id TEXT NOT NULL,
+    group_index INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    PRIMARY KEY (job_id, group_index, position)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_group_members_file ON group_members(file_id);
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    job_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    inode INTEGER,
+    size INTEGER,
+    mtime REAL,
+    PRIMARY KEY (job_id, path)
+) WITHOUT ROWID;
 """
 
 
 class SQLiteStore:
-    def __init__(self, path: Path = DB_PATH) -> None:
+    """App database (WAL): one locked writer connection and a pool of read-only ones."""
+
+    def __init__(self, path: Path = DB_PATH, readers: int = READ_POOL_SIZE) -> None:
         self.path = path
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = threading.Lock()
-        self._init_db()
+        self._lock = threading.Lock()  # held while the writer connection is in use
+        # Opened on first use, so importing a module that holds a store touches no file
+        self._writer: Optional[sqlite3.Connection] = None
+        self._idle: List[sqlite3.Connection] = []
+        # Threads waiting for a reader, served in arrival order: (wake-up event, handed-over connection)
+        self._waiters: Deque[List] = deque()
+        self._pool_size = readers
+        self._opened = 0
+        self._pool_lock = threading.Lock()
 
-    def _connect(self):
-        return sqlite3.connect(self.path, check_same_thread=False)
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        return conn
 
-    def _init_db(self) -> None:
-        with self._lock, self._connect() as conn:
-            conn.executescript(SCHEMA)
-            conn.commit()
+    def _open(self) -> sqlite3.Connection:
+        """The writer connection, opened with the schema created or migrated; called with the lock held."""
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            writer = self._connect()
+            try:
+                writer.execute("PRAGMA journal_mode=WAL")
+                self._init_db(writer)
+                writer.commit()
+            except BaseException:
+                writer.close()
+                raise
+            self._writer = writer
+        return self._writer
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """The writer connection; committed on success, rolled back on error."""
+        with self._lock:
+            self._open()
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    @contextmanager
+    def _read(self) -> Iterator[sqlite3.Connection]:
+        """A pooled reader inside one read transaction, so every query sees the same snapshot."""
+        if self._writer is None:
+            with self._lock:
+                self._open()  # the schema must exist before the first read
+        conn = self._acquire_reader()
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            conn.rollback()
+            self._release_reader(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._opened >= self._pool_size:
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+            else:
+                self._opened += 1
+                waiter = None
+        if waiter is None:
+            try:
+                return self._connect(readonly=True)
+            except Exception:
+                with self._pool_lock:
+                    self._opened -= 1
+                raise
+        waiter[0].wait()
+        return waiter[1]
+
+    def _release_reader(self, conn: sqlite3.Connection) -> None:
+        # Hand the connection straight to the longest waiting thread, so a busy thread cannot
+        # take it back before a waiter wakes up
+        with self._pool_lock:
+            if not self._waiters:
+                self._idle.append(conn)
+                return
+            waiter = self._waiters.popleft()
+        waiter[1] = conn
+        waiter[0].set()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        with self._pool_lock:
+            for conn in self._idle:
+                conn.close()
+            self._opened -= len(self._idle)
+            self._idle.clear()
+
+    def _init_db(self, conn: sqlite3.Connection) -> None:
+        columns = [col[1] for col in conn.execute("PRAGMA table_info(groups)").fetchall()]
+        legacy = "files" in columns
+        if legacy:
+            # Groups used to be stored as JSON blobs (files, suggested path, stats per row)
+            conn.execute("ALTER TABLE groups RENAME TO groups_json")
+        conn.executescript(SCHEMA)
+        if legacy:
+            self._migrate_json_groups(conn)
+
+    def _migrate_json_groups(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute(
+            "SELECT job_id, group_index, files, suggested, stats FROM groups_json ORDER BY job_id, group_index"
+        )
+        for batch in chunked(rows, WRITE_BATCH):
+            by_job: Dict[str, List[GroupResult]] = {}
+            for job_id, group_index, files, suggested, stats in batch:
+                by_job.setdefault(job_id, []).append(
+                    GroupResult(
+                        id=group_index,
+                        files=json.loads(files),
+                        suggested=suggested,
+                        stats=json.loads(stats) if stats else {},
+                    )
+                )
+            for job_id, groups in by_job.items():
+                self._insert_groups(conn, job_id, groups, present=False)
+        conn.execute("DROP TABLE groups_json")
+        logging.info("Migrated JSON groups to the normalized schema")
 
     def rebuild(self) -> None:
-        with self._lock, self._connect() as conn:
-            conn.executescript("DROP TABLE IF EXISTS groups; DROP TABLE IF EXISTS jobs;")
+        with self._write() as conn:
+            conn.executescript(
+                """
+                DROP TABLE IF EXISTS snapshots;
+                DROP TABLE IF EXISTS group_members;
+                DROP TABLE IF EXISTS groups;
+                DROP TABLE IF EXISTS files;
+                DROP TABLE IF EXISTS jobs;
+                """
+            )
             conn.executescript(SCHEMA)
-            conn.commit()
 
     def save_job(self, job: ScanJob) -> None:
-        with self._lock, self._connect() as conn:
+        with self._write() as conn:
             conn.execute(
                 """
-                INSERT INTO jobs (id, directories, primary_dir, threshold, algorithm, workers, hash_db, hash_size, status, message, created_at, finished_at, cancel_requested)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO jobs (id, directories, primary_dir, threshold, algorithm, workers, hash_db, hash_size, status, message, created_at, finished_at, cancel_requested, group_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ON CONFLICT(id) DO UPDATE SET
                     directories=excluded.directories,
                     primary_dir=excluded.primary_dir,
@@ -77,7 +290,8 @@ class SQLiteStore:
                     message=excluded.message,
                     created_at=excluded.created_at,
                     finished_at=excluded.finished_at,
-                    cancel_requested=excluded.cancel_requested
+                    cancel_requested=excluded.cancel_requested,
+                    group_count=excluded.group_count
                 """,
                 (
                     job.id,
@@ -93,53 +307,315 @@ class SQLiteStore:
                     job.created_at,
                     job.finished_at,
                     1 if job.cancel_requested else 0,
+                    job.group_count,
                 ),
             )
-            conn.commit()
 
-    def save_groups(self, job_id: str, groups: List[GroupResult]) -> None:
-        with self._lock, self._connect() as conn:
+    def save_groups(self, job_id: str, groups: Iterable[GroupResult]) -> None:
+        """Replace a job's groups, consuming `groups` in batches (one transaction each)."""
+        with self._write() as conn:
+            conn.execute("DELETE FROM group_members WHERE job_id = ?", (job_id,))
             conn.execute("DELETE FROM groups WHERE job_id = ?", (job_id,))
-            conn.executemany(
+        for batch in chunked(groups, WRITE_BATCH):
+            self.append_groups(job_id, batch)
+
+    def append_groups(self, job_id: str, groups: List[GroupResult]) -> None:
+        """Add groups to a job without touching the ones already stored (used while a scan streams results)."""
+        if not groups:
+            return
+        with self._write() as conn:
+            self._insert_groups(conn, job_id, groups)
+
+    def _insert_groups(
+        self, conn: sqlite3.Connection, job_id: str, groups: List[GroupResult], present: bool = True
+    ) -> None:
+        """Upsert the groups' files and write groups and members (`present`: scanned just now, so live again)."""
+        paths = list(dict.fromkeys(path for gr in groups for path in gr.files))
+        if present:
+            self._set_missing(conn, paths, False)
+        meta = {path: gr.stats.get(path) or {} for gr in groups for path in gr.files}
+        conn.executemany(
+            f"""
+            INSERT INTO files (path, {", ".join(STAT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                {", ".join(f"{col}=COALESCE(excluded.{col}, {col})" for col in STAT_COLUMNS)}
+            """,
+            [(path, *(meta[path].get(col) for col in STAT_COLUMNS)) for path in paths],
+        )
+        ids = self._file_ids(conn, paths)
+        conn.executemany(
+            "INSERT OR REPLACE INTO groups (job_id, group_index, suggested_id, live) VALUES (?, ?, ?, ?)",
+            [(job_id, gr.id, ids.get(gr.suggested), len(gr.files)) for gr in groups],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO group_members (job_id, group_index, position, file_id) VALUES (?, ?, ?, ?)",
+            [(job_id, gr.id, pos, ids[path]) for gr in groups for pos, path in enumerate(gr.files)],
+        )
+
+    @staticmethod
+    def _file_ids(conn: sqlite3.Connection, paths: Sequence[str]) -> Dict[str, int]:
+        ids: Dict[str, int] = {}
+        for chunk in chunked(paths):
+            ids.update(
+                (path, file_id)
+                for file_id, path in conn.execute(
+                    f"SELECT id, path FROM files WHERE path IN ({_placeholders(chunk)})", chunk
+                )
+            )
+        return ids
+
+    @staticmethod
+    def _set_missing(conn: sqlite3.Connection, paths: Iterable[str], missing: bool) -> int:
+        """Flag files missing (or present again) and keep every group's live count in step."""
+        flag, delta = (1, -1) if missing else (0, 1)
+        changed = 0
+        for chunk in chunked(paths):
+            ids = [
+                file_id
+                for (file_id,) in conn.execute(
+                    f"SELECT id FROM files WHERE missing != ? AND path IN ({_placeholders(chunk)})", (flag, *chunk)
+                )
+            ]
+            if not ids:
+                continue
+            marks = _placeholders(ids)
+            conn.execute(f"UPDATE files SET missing = ? WHERE id IN ({marks})", (flag, *ids))
+            # one adjustment per member row, so a group losing two files drops by two
+            conn.execute(
+                f"""
+                UPDATE groups SET live = live + ? * (
+                    SELECT COUNT(*) FROM group_members m
+                    WHERE m.job_id = groups.job_id AND m.group_index = groups.group_index AND m.file_id IN ({marks})
+                )
+                WHERE (job_id, group_index) IN (
+                    SELECT job_id, group_index FROM group_members WHERE file_id IN ({marks})
+                )
+                """,
+                (delta, *ids, *ids),
+            )
+            changed += len(ids)
+        return changed
+
+    def mark_missing(self, paths: Iterable[str], missing: bool = True) -> int:
+        """Record files as gone from disk (or back again); returns how many changed state."""
+        with self._write() as conn:
+            changed = self._set_missing(conn, paths, missing)
+        return changed
+
+    def page_groups(
+        self, job_id: str, limit: int, offset: int = 0, after: Optional[int] = None
+    ) -> Tuple[int, List[GroupResult]]:
+        """(count of groups with a live file, page of them without missing files); `after` pages by group id."""
+        with self._read() as conn:
+            (total,) = conn.execute(
+                "SELECT COUNT(*) FROM groups WHERE job_id = ? AND live > 0", (job_id,)
+            ).fetchone()
+            if after is not None:
+                heads = conn.execute(
+                    """
+                    SELECT group_index, suggested_id FROM groups
+                    WHERE job_id = ? AND live > 0 AND group_index > ?
+                    ORDER BY group_index LIMIT ?
+                    """,
+                    (job_id, after, limit),
+                ).fetchall()
+            else:
+                heads = conn.execute(
+                    """
+                    SELECT group_index, suggested_id FROM groups
+                    WHERE job_id = ? AND live > 0
+                    ORDER BY group_index LIMIT ? OFFSET ?
+                    """,
+                    (job_id, limit, offset),
+                ).fetchall()
+            groups = self._load_members(conn, job_id, heads, live_only=True)
+        return total, groups
+
+    def load_groups(self, job_id: str) -> List[GroupResult]:
+        """Every group of a job, including missing files."""
+        with self._read() as conn:
+            heads = conn.execute(
+                "SELECT group_index, suggested_id FROM groups WHERE job_id = ? ORDER BY group_index", (job_id,)
+            ).fetchall()
+            return self._load_members(conn, job_id, heads, live_only=False)
+
+    def load_group(self, job_id: str, group_id: int) -> Optional[GroupResult]:
+        """One group of a job with its live files only (None if it has none left)."""
+        with self._read() as conn:
+            heads = conn.execute(
+                "SELECT group_index, suggested_id FROM groups WHERE job_id = ? AND group_index = ? AND live > 0",
+                (job_id, group_id),
+            ).fetchall()
+            groups = self._load_members(conn, job_id, heads, live_only=True)
+        return groups[0] if groups else None
+
+    @staticmethod
+    def _load_members(
+        conn: sqlite3.Connection, job_id: str, heads: Sequence[Tuple[int, Optional[int]]], live_only: bool
+    ) -> List[GroupResult]:
+        groups = {index: GroupResult(id=index, files=[], suggested=None, stats={}) for index, _ in heads}
+        suggested_ids = {index: suggested_id for index, suggested_id in heads}
+        for chunk in chunked(groups):
+            rows = conn.execute(
+                f"""
+                SELECT m.group_index, f.id, f.path, f.missing, {", ".join(f"f.{col}" for col in STAT_COLUMNS)}
+                FROM group_members m JOIN files f ON f.id = m.file_id
+                WHERE m.job_id = ? AND m.group_index IN ({_placeholders(chunk)})
+                ORDER BY m.group_index, m.position
+                """,
+                (job_id, *chunk),
+            )
+            for group_index, file_id, path, missing, *stat_row in rows:
+                if live_only and missing:
+                    continue
+                group = groups[group_index]
+                group.files.append(path)
+                group.stats[path] = _stats_record(stat_row)
+                if file_id == suggested_ids[group_index]:
+                    group.suggested = path
+        return [groups[index] for index, _ in heads]
+
+    def group_of(self, job_id: str, path: str) -> Optional[int]:
+        """Id of the first group of a job that contains `path`."""
+        with self._read() as conn:
+            row = conn.execute(
                 """
-                INSERT INTO groups (job_id, group_index, files, suggested, stats)
-                VALUES (?, ?, ?, ?, ?)
+                SELECT MIN(m.group_index) FROM files f JOIN group_members m ON m.file_id = f.id
+                WHERE f.path = ? AND m.job_id = ?
                 """,
-                [
-                    (
-                        job_id,
-                        gr.id,
-                        json.dumps(gr.files),
-                        gr.suggested,
-                        json.dumps(gr.stats),
+                (path, job_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def referenced_paths(self, paths: Iterable[str]) -> Set[str]:
+        """Those of `paths` that belong to a group of any job."""
+        found: Set[str] = set()
+        with self._read() as conn:
+            for chunk in chunked(paths):
+                found.update(
+                    path
+                    for (path,) in conn.execute(
+                        f"""
+                        SELECT f.path FROM files f
+                        WHERE f.path IN ({_placeholders(chunk)})
+                        AND EXISTS (SELECT 1 FROM group_members m WHERE m.file_id = f.id)
+                        """,
+                        chunk,
                     )
-                    for gr in groups
-                ],
+                )
+        return found
+
+    def job_files(self, job_id: str) -> List[Tuple[str, bool]]:
+        """(path, missing) for every distinct file referenced by a job's groups."""
+        with self._read() as conn:
+            rows = conn.execute(
+                """
+                SELECT DISTINCT f.path, f.missing FROM group_members m JOIN files f ON f.id = m.file_id
+                WHERE m.job_id = ?
+                """,
+                (job_id,),
+            ).fetchall()
+        return [(path, bool(missing)) for path, missing in rows]
+
+    def root_plan(self, job_id: str, root: str) -> Tuple[int, int, int, int]:
+        """(groups, files outside `root` to drop, files kept, bytes freed) over groups with a live file inside it."""
+        with self._read() as conn:
+            return conn.execute(
+                f"""
+                SELECT COUNT(*), COALESCE(SUM(outside), 0), COALESCE(SUM(inside), 0), COALESCE(SUM(bytes), 0)
+                FROM (
+                    SELECT SUM(inside) AS inside, SUM(NOT inside) AS outside,
+                           SUM(CASE WHEN inside THEN 0 ELSE COALESCE(size, 0) END) AS bytes
+                    FROM ({_ROOT_MEMBERS}) GROUP BY group_index
+                )
+                WHERE inside > 0 AND outside > 0
+                """,
+                _root_args(job_id, root),
+            ).fetchone()
+
+    def outside_root(self, job_id: str, root: str) -> List[str]:
+        """Live files outside `root` of the groups that have a live file inside it (see root_plan)."""
+        with self._read() as conn:
+            rows = conn.execute(
+                f"""
+                WITH members AS ({_ROOT_MEMBERS})
+                SELECT DISTINCT path FROM members
+                WHERE NOT inside AND group_index IN (SELECT group_index FROM members WHERE inside)
+                """,
+                _root_args(job_id, root),
+            ).fetchall()
+        return [path for (path,) in rows]
+
+    def save_snapshot(
+        self,
+        job_id: str,
+        entries: Iterable[Tuple[str, int, int, float]],
+        replaces: Optional[str] = None,
+    ) -> None:
+        """Store a job's (path, inode, size, mtime) file snapshot, dropping the one it supersedes."""
+        with self._write() as conn:
+            if replaces:
+                conn.execute("DELETE FROM snapshots WHERE job_id = ?", (replaces,))
+            conn.execute("DELETE FROM snapshots WHERE job_id = ?", (job_id,))
+            conn.executemany(
+                "INSERT INTO snapshots (job_id, path, inode, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                ((job_id, path, inode, size, mtime) for path, inode, size, mtime in entries),
             )
+
+    def load_snapshot(self, job_id: str) -> Dict[str, Tuple[int, int, float]]:
+        with self._read() as conn:
+            rows = conn.execute(
+                "SELECT path, inode, size, mtime FROM snapshots WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {path: (inode, size, mtime) for path, inode, size, mtime in rows}
+
+    def delete_jobs(self, job_ids: Sequence[str]) -> None:
+        """Delete jobs with their groups and snapshots (their files rows are left to compact())."""
+        with self._write() as conn:
+            for chunk in chunked(job_ids):
+                marks = _placeholders(chunk)
+                for table in ("group_members", "groups", "snapshots"):
+                    conn.execute(f"DELETE FROM {table} WHERE job_id IN ({marks})", chunk)
+                conn.execute(f"DELETE FROM jobs WHERE id IN ({marks})", chunk)
+
+    def compact(self) -> int:
+        """Drop files rows no group references (VACUUM once enough pages are free); returns how many."""
+        with self._write() as conn:
+            removed = conn.execute(
+                "DELETE FROM files WHERE NOT EXISTS (SELECT 1 FROM group_members m WHERE m.file_id = files.id)"
+            ).rowcount
             conn.commit()
+            (pages,) = conn.execute("PRAGMA page_count").fetchone()
+            (free,) = conn.execute("PRAGMA freelist_count").fetchone()
+            if pages and free / pages >= VACUUM_FREE_RATIO:
+                conn.execute("VACUUM")
+                logging.info("Vacuumed %s (%d of %d pages were free)", self.path, free, pages)
+        return removed
 
     def load_jobs(self) -> List[ScanJob]:
-        with self._lock, self._connect() as conn:
+        """Job headers only; groups are loaded on demand with load_groups."""
+        with self._write() as conn:
             # Check if cancel_requested column exists, if not add it
             cursor = conn.execute("PRAGMA table_info(jobs)")
             columns = [col[1] for col in cursor.fetchall()]
             if "cancel_requested" not in columns:
                 conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER DEFAULT 0")
                 conn.commit()
+            if "group_count" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN group_count INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    "UPDATE jobs SET group_count = (SELECT COUNT(*) FROM groups WHERE groups.job_id = jobs.id)"
+                )
+                conn.commit()
 
             jobs: List[ScanJob] = []
-            job_rows = conn.execute("SELECT * FROM jobs").fetchall()
-            group_rows = conn.execute("SELECT job_id, group_index, files, suggested, stats FROM groups").fetchall()
-        group_map = {}
-        for job_id, group_index, files, suggested, stats in group_rows:
-            group_map.setdefault(job_id, []).append(
-                GroupResult(
-                    id=group_index,
-                    files=json.loads(files),
-                    suggested=suggested,
-                    stats=json.loads(stats) if stats else {},
-                )
-            )
+            job_rows = conn.execute(
+                """
+                SELECT id, directories, primary_dir, threshold, algorithm, workers, hash_db, hash_size,
+                       status, message, created_at, finished_at, cancel_requested, group_count
+                FROM jobs
+                """
+            ).fetchall()
         for row in job_rows:
             (
                 job_id,
@@ -155,6 +631,7 @@ class SQLiteStore:
                 created_at,
                 finished_at,
                 cancel_requested,
+                group_count,
             ) = row
             jobs.append(
                 ScanJob(
@@ -170,7 +647,7 @@ class SQLiteStore:
                     message=message or "",
                     created_at=created_at,
                     finished_at=finished_at,
-                    groups=sorted(group_map.get(job_id, []), key=lambda g: g.id),
+                    group_count=group_count,
                     cancel_requested=bool(cancel_requested),
                 )
             )
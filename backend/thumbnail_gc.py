@@ -0,0 +1,97 @@
+"""
+Incremental garbage collection of the thumbnail cache.
+Every thumbnail records the source file (resolved path) and mtime it was made from. A daemon
+thread walks that manifest a batch at a time, within a small time budget per tick, and deletes
+thumbnails whose source is gone or has changed since, and ones no job's groups refer to any more.
+Unreferenced thumbnails get a grace period, so ones cached while a scan is still streaming its
+groups to the store survive. Contact sheets and entries migrated from loose files carry no
+source and are left to LRU eviction.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from backend.storage import SQLiteStore
+from backend.utils.thumbnail_store import ThumbnailStore
+
+# Seconds between collection ticks
+GC_INTERVAL = 60.0
+# Seconds of work per tick
+GC_BUDGET = 0.25
+# Manifest entries examined per step
+GC_BATCH = 500
+# Seconds an unreferenced thumbnail is kept after its last use
+GC_GRACE = 3600.0
+
+
+class ThumbnailGC:
+    def __init__(self, store: SQLiteStore, thumbnails: ThumbnailStore) -> None:
+        self._store = store
+        self._thumbnails = thumbnails
+        self._lock = threading.Lock()
+        self._cursor = 0  # manifest rowid the next step continues after
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="thumbnail-gc", daemon=True)
+            self._thread.start()
+
+    def collect(self, budget: Optional[float] = GC_BUDGET) -> Dict[str, int]:
+        """
+        Examine manifest entries from where the last call stopped until `budget` seconds have
+        passed or the end of the manifest is reached (the next call starts over).
+        budget=None: one full pass from the start.
+        """
+        deadline = time.monotonic() + budget if budget is not None else None
+        stats = {"scanned": 0, "deleted": 0, "errors": 0}
+        with self._lock:
+            if deadline is None:
+                self._cursor = 0
+            while deadline is None or time.monotonic() < deadline:
+                rows = self._thumbnails.manifest(self._cursor, GC_BATCH)
+                if not rows:
+                    self._cursor = 0
+                    break
+                self._cursor = rows[-1][0]
+                doomed, errors = self._stale(rows)
+                stats["scanned"] += len(rows)
+                stats["deleted"] += self._thumbnails.delete(doomed)
+                stats["errors"] += errors
+        return stats
+
+    def _stale(self, rows: Sequence[Tuple[int, str, Optional[str], Optional[float], float]]) -> Tuple[List[str], int]:
+        """Keys of manifest rows to delete, and how many sources could not be checked."""
+        referenced = self._store.referenced_paths({source for _, _, source, _, _ in rows if source})
+        now = time.time()
+        doomed: List[str] = []
+        errors = 0
+        for _, key, source, mtime, last_access in rows:
+            if not source:
+                continue
+            try:
+                current = os.stat(source).st_mtime
+            except FileNotFoundError:
+                doomed.append(key)
+                continue
+            except OSError:
+                errors += 1
+                continue
+            if current != mtime or (source not in referenced and now - last_access > GC_GRACE):
+                doomed.append(key)
+        return doomed, errors
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(GC_INTERVAL)
+            try:
+                stats = self.collect()
+                if stats["deleted"]:
+                    logging.info("Thumbnail GC removed %d of %d entries checked", stats["deleted"], stats["scanned"])
+            except Exception:  # noqa: BLE001
+                logging.exception("Thumbnail GC failed")
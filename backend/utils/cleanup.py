@@ -1,51 +1,21 @@
-from pathlib import Path
-import hashlib
 from typing import Dict
-from backend.config import THUMBNAIL_CACHE_DIR, THUMBNAIL_MAX_SIZE, DATA_DIR
+from backend.config import HASH_DB, THUMBNAIL_CACHE_DIR
+from backend.utils.thumbnails import THUMBNAILS
 import logging
 
 
-def _compute_thumbnail_path(source_path: Path, max_size: int = THUMBNAIL_MAX_SIZE) -> Path:
-    """Calculate thumbnail cache path (same logic as thumbnails.py)"""
-    if not source_path.exists():
-        return None
-
-    hash_input = f"{source_path.resolve()}:{source_path.stat().st_mtime}:{max_size}"
-    hash_key = hashlib.sha1(hash_input.encode()).hexdigest()
-    return THUMBNAIL_CACHE_DIR / f"{hash_key}.jpg"
-
-
 def cleanup_orphaned_thumbnails() -> Dict[str, int]:
-    """Delete thumbnails for images that no longer exist"""
-    from backend.state import JOB_STORE
-
-    deleted = 0
-    errors = 0
+    """Delete thumbnails of images that were deleted, changed, or are no longer in any job (one full GC pass)"""
+    from backend.api.routes import THUMBNAIL_GC
 
-    # Get all image paths from database
-    for job in JOB_STORE.all():
-        for group in job.groups:
-            for file_path in group.files:
-                source = Path(file_path)
-                if not source.exists():
-                    # Image deleted/moved - remove thumbnail
-                    try:
-                        thumbnail = _compute_thumbnail_path(source, THUMBNAIL_MAX_SIZE)
-                        if thumbnail and thumbnail.exists():
-                            thumbnail.unlink()
-                            deleted += 1
-                    except Exception as e:
-                        logging.warning(f"Failed to delete thumbnail for {file_path}: {e}")
-                        errors += 1
-
-    return {"deleted": deleted, "errors": errors}
+    return THUMBNAIL_GC.collect(budget=None)
 
 
 def reset_all_app_data() -> Dict[str, bool]:
     """Nuclear reset: Delete ALL app data"""
     from fastapi import HTTPException
     from backend.state import JOB_STORE
-    from backend.api.routes import STORE
+    from backend.api.routes import LIVENESS, PREWARM, STATS, STORE
 
     # Safety check: Don't reset during active scan
     active_jobs = [j for j in JOB_STORE.all() if j.status in ["pending", "running"]]
@@ -53,9 +23,11 @@ def reset_all_app_data() -> Dict[str, bool]:
         raise HTTPException(400, "Cannot reset - scan in progress")
 
     results = {}
+    PREWARM.stop()
 
     # 1. Delete all thumbnails
     try:
+        THUMBNAILS.clear()
         for thumbnail in THUMBNAIL_CACHE_DIR.glob("*.jpg"):
             thumbnail.unlink()
         results["thumbnails"] = True
@@ -63,20 +35,29 @@ def reset_all_app_data() -> Dict[str, bool]:
         logging.error(f"Failed to delete thumbnails: {e}")
         results["thumbnails"] = False
 
-    # 2. Delete hash cache
+    # 2. Delete hash cache (SQLite store, its WAL files, and per-parameter library JSON caches)
     try:
-        hash_cache = DATA_DIR / "hash_cache.json"
-        if hash_cache.exists():
+        patterns = (f"{HASH_DB.name}*", f"{HASH_DB.stem}.db*", f"{HASH_DB.stem}*.json")
+        for hash_cache in {p for pattern in patterns for p in HASH_DB.parent.glob(pattern)}:
             hash_cache.unlink()
         results["hash_cache"] = True
     except Exception as e:
         logging.error(f"Failed to delete hash cache: {e}")
         results["hash_cache"] = False
 
-    # 3. Rebuild database (wipe all tables)
+    # 3. Clear the per-file stats cache (its connection stays open, so empty it rather than unlink)
+    try:
+        STATS.clear()
+        results["stats_cache"] = True
+    except Exception as e:
+        logging.error(f"Failed to clear stats cache: {e}")
+        results["stats_cache"] = False
+
+    # 4. Rebuild database (wipe all tables)
     try:
         STORE.rebuild()
         JOB_STORE.reset([])
+        LIVENESS.forget()
         results["database"] = True
     except Exception as e:
         logging.error(f"Failed to rebuild database: {e}")
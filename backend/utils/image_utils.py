@@ -5,48 +5,66 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Sequence
 
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageOps
 
+from backend.core.decode import LANCZOS, decode_fit
+from backend.utils.thumbnails import cache_thumbnails
 
-def _calculate_sharpness(path: Path) -> float:
+# Sharpness is measured on a reduced decode so images of different resolutions compare fairly
+SHARPNESS_MAX_SIZE = 1024
+
+
+def _calculate_sharpness(img: Image.Image) -> float:
     """
-    Calculate a sharpness score for an image using the variance of the Laplacian.
+    Calculate a sharpness score for a decoded image using the variance of the Laplacian.
     Returns 0.0 on failure.
     """
     try:
-        # Open image with PIL first, then convert to numpy array for OpenCV
-        with Image.open(path) as img:
-            # Convert to grayscale numpy array
-            img_np = np.array(img.convert("L"))
-            # Apply Laplacian filter and calculate variance
-            return cv2.Laplacian(img_np, cv2.CV_64F).var()
+        if max(img.size) > SHARPNESS_MAX_SIZE:
+            img = img.copy()
+            img.thumbnail((SHARPNESS_MAX_SIZE, SHARPNESS_MAX_SIZE), LANCZOS, reducing_gap=None)
+        # Convert to grayscale numpy array for OpenCV
+        img_np = np.array(img.convert("L"))
+        # Apply Laplacian filter and calculate variance
+        return cv2.Laplacian(img_np, cv2.CV_64F).var()
     except Exception as err:
-        logging.warning("Failed to calculate sharpness for %s: %s", path, err)
+        logging.warning("Failed to calculate sharpness: %s", err)
         return 0.0
 
 
-def image_stats(path: Path) -> Dict:
+def image_stats(path: Path, thumbnail_sizes: Sequence[int] = ()) -> Dict:
     """
-    Return width, height, pixel count, EXIF count, and mtime for a file.
+    Return width, height, pixel count, EXIF count, sharpness, mtime and size (bytes) for a file.
+    The file is opened and decoded once: dimensions and EXIF come from the header, sharpness
+    from a single reduced decode, and the cached thumbnails for `thumbnail_sizes` are written
+    from that same decode.
     Fallback to zeros on failure.
     """
     try:
+        st = path.stat()
         with Image.open(path) as img:
             width, height = img.size
             exif = img.getexif() or {}
-            sharpness = _calculate_sharpness(path) # Calculate sharpness
-            return {
-                "width": width,
-                "height": height,
-                "pixels": width * height,
-                "exif_count": len(exif),
-                "mtime": path.stat().st_mtime,
-                "sharpness": sharpness, # Add sharpness to the stats
-            }
+            decoded = decode_fit(img, max(SHARPNESS_MAX_SIZE, *thumbnail_sizes))
+        sharpness = _calculate_sharpness(decoded)
+        if thumbnail_sizes:
+            try:
+                cache_thumbnails(path, ImageOps.exif_transpose(decoded), thumbnail_sizes)
+            except Exception as err:  # noqa: BLE001
+                logging.warning("Failed to cache thumbnails for %s: %s", path, err)
+        return {
+            "width": width,
+            "height": height,
+            "pixels": width * height,
+            "exif_count": len(exif),
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "sharpness": sharpness,
+        }
     except Exception as err:  # noqa: BLE001
         logging.warning("Failed to read metadata for %s: %s", path, err)
         try:
@@ -62,7 +80,12 @@ def image_stats(path: Path) -> Dict:
             return {"width": 0, "height": 0, "pixels": 0, "exif_count": 0, "mtime": 0.0}
 
 
-def suggest_keeper(paths: list[Path], primary_dir: Optional[Path] = None, enable_sharpness_check: bool = False) -> Path:
+def suggest_keeper(
+    paths: list[Path],
+    primary_dir: Optional[Path] = None,
+    enable_sharpness_check: bool = False,
+    stats: Optional[Dict[str, Dict]] = None,
+) -> Path:
     """
     Choose a keeper using simple heuristics:
     - prefer within primary_dir (if provided)
@@ -71,8 +94,10 @@ def suggest_keeper(paths: list[Path], primary_dir: Optional[Path] = None, enable
     - then higher EXIF count
     - then newer mtime
     - then shorter path for stability
+    stats: precomputed image_stats keyed by str(path); missing entries are computed.
     """
-    stats_cache = {p: image_stats(p) for p in paths}
+    stats = stats or {}
+    stats_cache = {p: stats.get(str(p)) or image_stats(p) for p in paths}
 
     def score(p: Path) -> tuple:
         meta = stats_cache[p]
@@ -81,7 +106,7 @@ def suggest_keeper(paths: list[Path], primary_dir: Optional[Path] = None, enable
         # Build the scoring tuple dynamically
         score_tuple = [in_primary]
         if enable_sharpness_check:
-            score_tuple.append(meta["sharpness"])
+            score_tuple.append(meta.get("sharpness", 0.0))
         score_tuple.extend([
             meta["pixels"],
             meta["exif_count"],
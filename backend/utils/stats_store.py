@@ -0,0 +1,132 @@
+"""Per-file image stats cache in SQLite, valid while a file's size and mtime match."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from backend.core.sqlite_utils import chunked
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stats (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    exif_count INTEGER NOT NULL,
+    sharpness REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# (path, size, mtime)
+FileKey = Tuple[str, int, float]
+
+
+class StatsStore:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        # Opened on first use, so importing a module that holds a store touches no file
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The connection, opened with the schema created; used with the lock held."""
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            conn.commit()
+            self._db = conn
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def lookup(self, files: Sequence[FileKey]) -> Dict[str, Dict]:
+        """Return cached stats records for files whose size and mtime are unchanged."""
+        wanted = {path: (size, mtime) for path, size, mtime in files}
+        found: Dict[str, Dict] = {}
+        with self._lock:
+            for chunk in chunked(wanted):
+                rows = self._conn.execute(
+                    f"""
+                    SELECT path, size, mtime, width, height, exif_count, sharpness FROM stats
+                    WHERE path IN ({",".join("?" * len(chunk))})
+                    """,
+                    chunk,
+                ).fetchall()
+                for path, size, mtime, width, height, exif_count, sharpness in rows:
+                    if wanted[path] != (size, mtime):
+                        continue
+                    found[path] = {
+                        "width": width,
+                        "height": height,
+                        "pixels": width * height,
+                        "exif_count": exif_count,
+                        "mtime": mtime,
+                        "size": size,
+                        "sharpness": sharpness,
+                    }
+        return found
+
+    def store(self, rows: Iterable[Tuple[str, int, float, Dict]]) -> None:
+        """Upsert (path, size, mtime, stats record) rows."""
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO stats (path, size, mtime, width, height, exif_count, sharpness)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    size=excluded.size,
+                    mtime=excluded.mtime,
+                    width=excluded.width,
+                    height=excluded.height,
+                    exif_count=excluded.exif_count,
+                    sharpness=excluded.sharpness
+                """,
+                [
+                    (
+                        path,
+                        size,
+                        mtime,
+                        meta["width"],
+                        meta["height"],
+                        meta["exif_count"],
+                        float(meta.get("sharpness", 0.0)),
+                    )
+                    for path, size, mtime, meta in rows
+                ],
+            )
+            self._conn.commit()
+
+    def evict(self, roots: Iterable[str], keep: Set[str]) -> int:
+        """Delete rows below `roots` for files not in `keep` (what a scan of them found); returns the count."""
+        stale: List[str] = []
+        with self._lock:
+            for root in roots:
+                prefix = root.rstrip(os.sep) + os.sep
+                # Range scan over the primary key instead of LIKE, which would need escaping
+                rows = self._conn.execute(
+                    "SELECT path FROM stats WHERE path >= ? AND path < ?",
+                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1)),
+                )
+                stale.extend(path for (path,) in rows if path not in keep)
+            for chunk in chunked(stale):
+                self._conn.execute(f"DELETE FROM stats WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+            self._conn.commit()
+        return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM stats")
+            self._conn.commit()
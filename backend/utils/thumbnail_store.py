@@ -0,0 +1,206 @@
+"""Thumbnail cache packed into one SQLite database, kept under a byte budget by LRU eviction."""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.core.sqlite_utils import SQLITE_MAX_VARIABLES, chunked
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    source TEXT,  -- resolved source path (NULL for contact sheets and migrated loose files)
+    mtime REAL  -- source mtime the thumbnail was made from
+);
+
+CREATE INDEX IF NOT EXISTS idx_thumbnails_access ON thumbnails(last_access);
+"""
+
+# Buffered access times are written once this many are pending
+TOUCH_BATCH = 256
+# Eviction frees space down to this share of the budget, so it does not run on every insert
+LOW_WATER = 0.9
+# Loose files imported per transaction during migration
+MIGRATE_BATCH = 500
+
+
+class ThumbnailStore:
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Opened on first use, so importing a module that holds a store touches no file
+        self._db: Optional[sqlite3.Connection] = None
+        self._bytes = 0
+        self._touched: Dict[str, float] = {}
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The connection, opened with the schema created or upgraded; used with the lock held."""
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = [col[1] for col in conn.execute("PRAGMA table_info(thumbnails)").fetchall()]
+            if "source" not in columns:
+                conn.execute("ALTER TABLE thumbnails ADD COLUMN source TEXT")
+                conn.execute("ALTER TABLE thumbnails ADD COLUMN mtime REAL")
+            conn.commit()
+            (self._bytes,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM thumbnails").fetchone()
+            self._db = conn
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._flush_touches()
+                self._db.close()
+                self._db = None
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            self._conn  # counts the stored bytes when it opens the store
+            return self._bytes
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM thumbnails WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touches()
+                self._conn.commit()
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM thumbnails WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(
+        self,
+        key: str,
+        data: bytes,
+        last_access: Optional[float] = None,
+        source: Optional[str] = None,
+        mtime: Optional[float] = None,
+    ) -> None:
+        with self._lock:
+            self._insert(key, data, last_access or time.time(), source, mtime)
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, keys: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for chunk in chunked(keys):
+                marks = ",".join("?" * len(chunk))
+                (size,) = self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM thumbnails WHERE key IN ({marks})", chunk
+                ).fetchone()
+                removed += self._conn.execute(f"DELETE FROM thumbnails WHERE key IN ({marks})", chunk).rowcount
+                self._bytes -= size
+            self._conn.commit()
+        return removed
+
+    def manifest(self, after: int, limit: int) -> List[Tuple[int, str, Optional[str], Optional[float], float]]:
+        """(rowid, key, source, mtime, last access) of up to `limit` entries past rowid `after`."""
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT rowid, key, source, mtime, last_access FROM thumbnails
+                WHERE rowid > ? ORDER BY rowid LIMIT ?
+                """,
+                (after, limit),
+            ).fetchall()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM thumbnails")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
+            self._bytes = 0
+            self._touched.clear()
+
+    def migrate(self, directory: Path) -> int:
+        """Import loose `<key>.jpg` files from the old cache directory, deleting each one once stored."""
+        imported = 0
+        files = directory.glob("*.jpg")
+        while True:
+            batch: List[Path] = [f for _, f in zip(range(MIGRATE_BATCH), files)]
+            if not batch:
+                break
+            with self._lock:
+                for file in batch:
+                    try:
+                        self._insert(file.stem, file.read_bytes(), file.stat().st_atime)
+                    except OSError as err:
+                        logging.warning("Could not migrate thumbnail %s: %s", file, err)
+                self._evict()
+                self._conn.commit()
+            for file in batch:
+                file.unlink(missing_ok=True)
+            imported += len(batch)
+        if imported:
+            logging.info("Migrated %d loose thumbnails into %s", imported, self.path)
+        try:
+            directory.rmdir()
+        except OSError:
+            pass  # not empty: something else lives there
+        return imported
+
+    def _insert(
+        self, key: str, data: bytes, last_access: float, source: Optional[str] = None, mtime: Optional[float] = None
+    ) -> None:
+        old = self._conn.execute("SELECT size FROM thumbnails WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO thumbnails (key, data, size, last_access, source, mtime)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (key, data, len(data), last_access, source, mtime),
+        )
+        self._bytes += len(data) - (old[0] if old else 0)
+
+    def _flush_touches(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE thumbnails SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the store is back under LOW_WATER * max_bytes."""
+        if not self.max_bytes or self._bytes <= self.max_bytes:
+            return
+        self._flush_touches()
+        target = int(self.max_bytes * LOW_WATER)
+        evicted = 0
+        while self._bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM thumbnails ORDER BY last_access LIMIT ?", (SQLITE_MAX_VARIABLES,)
+            ).fetchall()
+            if not rows:
+                self._bytes = 0
+                break
+            doomed: List[str] = []
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                doomed.append(key)
+                self._bytes -= size
+            self._conn.execute(f"DELETE FROM thumbnails WHERE key IN ({','.join('?' * len(doomed))})", doomed)
+            evicted += len(doomed)
+        logging.info("Evicted %d thumbnails (cache now %d bytes)", evicted, self._bytes)
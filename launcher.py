@@ -8,6 +8,11 @@ import webbrowser
 import time
 import tkinter as tk
 from tkinter import messagebox
+import multiprocessing
+
+if __name__ == "__main__":
+    # Process-pool hashing re-launches this executable for its workers when frozen
+    multiprocessing.freeze_support()
 
 # Add error logging to file
 LOG_FILE = Path.home() / "FindSimilarImages_error.log"
@@ -28,7 +33,7 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # Override config paths
 os.environ['DB_PATH'] = str(DATA_DIR / "app.db")
-os.environ['HASH_DB'] = str(DATA_DIR / "hash_cache.json")
+os.environ['HASH_DB'] = str(DATA_DIR / "hash_cache.db")
 os.environ['DATA_DIR'] = str(DATA_DIR)
 
 log_error(f"Set DATA_DIR to: {DATA_DIR}")